@@ -1,5 +1,7 @@
 import math
 
+from util.inputs import read_lines
+
 
 def calc_fuel(mass): return math.floor(mass / 3) - 2
 
@@ -12,13 +14,16 @@ def calc_fuel_corrected(mass):
     return fuel + calc_fuel_corrected(fuel)
 
 
-with open('input.txt') as f:
-    s = f.readlines()
+def main():
     total = 0
     total_corrected = 0
-    for x in s:
+    for x in read_lines(__file__):
         total += calc_fuel(int(x))
         total_corrected += calc_fuel_corrected(int(x))
 
     print('Answer 1: %s' % total)
     print('Answer 2: %s' % total_corrected)
+
+
+if __name__ == '__main__':
+    main()
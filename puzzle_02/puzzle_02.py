@@ -1,6 +1,8 @@
 from _operator import add, mul
 from math import ceil
 
+from util.goalseek import goal_seek
+
 TEST_INPUT_1 = [
     ([1, 9, 10, 3, 2, 3, 11, 0, 99, 30, 40, 50], [3500, 9, 10, 70, 2, 3, 11, 0, 99, 30, 40, 50]),
     ([1, 0, 0, 0, 99], [2, 0, 0, 0, 99]),
@@ -39,15 +41,11 @@ def run_test_1():
 
 
 def answer_2(tape, target):
-    for noun in range(100):
-        for verb in range(100):
-            t = list(tape)
-            t[1] = noun
-            t[2] = verb
-            r = int_code(t)[0]
-            if r == target:
-                return noun * 100 + verb
-    return None
+    r = goal_seek(tape, [1, 2], [range(100), range(100)], target, 0)
+    if r is None:
+        return None
+    noun, verb = r
+    return noun * 100 + verb
 
 
 def main():
@@ -1,4 +1,12 @@
+import bisect
+import sys
+from collections import namedtuple
+from itertools import combinations
+from typing import Iterator
 
+import numpy as np
+
+from util.inputs import read_lines
 
 TEST_INPUT_2 = [
     ('R75,D30,R83,U83,L12,D49,R71,U7,L72','U62,R66,U55,R34,D71,R55,D58,R83', 610),
@@ -49,31 +57,245 @@ def unravel_2(w):
 def manhattan(coords): return abs(coords[0]) + abs(coords[1])
 
 
+# A straight run of a wire from (x1, y1) to (x2, y2), which it reaches after steps steps
+Segment = namedtuple('Segment', 'x1 y1 x2 y2 steps')
+
+Crossing = namedtuple('Crossing', 'point steps')
+
+
+def to_segments(w) -> [Segment]:
+    """
+    The wire as axis-aligned segments, so its size follows its number of turns rather than its length
+    """
+    segments = []
+    posx, posy = 0, 0
+    total_distance = 0
+    for (direction, distance) in w:
+        x, y = direction(posx, posy, distance)
+        segments.append(Segment(posx, posy, x, y, total_distance))
+        posx, posy = x, y
+        total_distance += distance
+    return segments
+
+
+def steps_to(segment: Segment, x: int, y: int) -> int:
+    return segment.steps + abs(x - segment.x1) + abs(y - segment.y1)
+
+
+def overlaps(s1: Segment, s2: Segment) -> Iterator[Crossing]:
+    """
+    Where two segments running along the same line cross. Steps change by one per point along the overlap,
+    so the fewest are at its ends, and the closest point to the origin is wherever it passes nearest 0.
+    """
+    horizontal = s1.y1 == s1.y2
+    fixed = s1.y1 if horizontal else s1.x1
+    if fixed != (s2.y1 if horizontal else s2.x1):
+        return
+    a = (s1.x1, s1.x2) if horizontal else (s1.y1, s1.y2)
+    b = (s2.x1, s2.x2) if horizontal else (s2.y1, s2.y2)
+    lo, hi = max(min(a), min(b)), min(max(a), max(b))
+    for v in {lo, hi, 0, 1, -1}:
+        if lo <= v <= hi:
+            x, y = (v, fixed) if horizontal else (fixed, v)
+            yield Crossing((x, y), steps_to(s1, x, y) + steps_to(s2, x, y))
+
+
+def segment_crossings(w1, w2) -> Iterator[Crossing]:
+    """
+    Every point two wires cross at other than the origin, with their combined steps to it.
+    A sweep line moves along x, keeping each wire's horizontal segments that span it sorted by y.
+    Each vertical segment reached looks up the other wire's horizontal segments within its span.
+    A point can be yielded more than once, by each pair of segments crossing there.
+    """
+    wires = [to_segments(w1), to_segments(w2)]
+    events = []
+    lines = {}
+    for i, segments in enumerate(wires):
+        for s in segments:
+            if s.x1 == s.x2 and s.y1 == s.y2:
+                continue
+            if s.y1 == s.y2:
+                # Horizontal segments are added before and removed after any vertical segment at the same x
+                events.append((min(s.x1, s.x2), 0, i, s))
+                events.append((max(s.x1, s.x2), 2, i, s))
+                lines.setdefault(('y', s.y1), ([], []))[i].append(s)
+            else:
+                events.append((s.x1, 1, i, s))
+                lines.setdefault(('x', s.x1), ([], []))[i].append(s)
+    events.sort(key=lambda e: e[:3])
+
+    # Each wire's horizontal segments spanning the sweep line, as (y, id(segment), segment)
+    active = ([], [])
+    for x, kind, i, s in events:
+        if kind == 0:
+            bisect.insort(active[i], (s.y1, id(s), s))
+        elif kind == 2:
+            active[i].remove((s.y1, id(s), s))
+        else:
+            other = active[1 - i]
+            start = bisect.bisect_left(other, (min(s.y1, s.y2),))
+            for y, _, h in other[start:]:
+                if y > max(s.y1, s.y2):
+                    break
+                yield Crossing((x, y), steps_to(s, x, y) + steps_to(h, x, y))
+
+    # Segments of both wires along the same line
+    for segments_1, segments_2 in lines.values():
+        for s1 in segments_1:
+            for s2 in segments_2:
+                yield from overlaps(s1, s2)
+
+
+def closest_crossing(w1, w2) -> int:
+    return min(manhattan(c.point) for c in segment_crossings(w1, w2) if c.point != (0, 0))
+
+
+def fewest_steps(w1, w2) -> Crossing:
+    return min((c for c in segment_crossings(w1, w2) if c.point != (0, 0)), key=lambda c: c.steps)
+
+
+# A wire's horizontal or vertical segments as columns: the fixed coordinate, the range of the other coordinate,
+# where along that range the segment starts, its steps at that start and its index in to_segments
+AxisArrays = namedtuple('AxisArrays', 'fixed lo hi start steps index')
+
+# Every crossing between wires i and j other than the origin, as an (n, 2) array of points and their combined steps
+PairCrossings = namedtuple('PairCrossings', 'i j points steps')
+
+# How many segment pairs to test at once, bounding the memory used by each pair of wires
+CHUNK_SIZE = 1 << 20
+
+
+def axis_arrays(segments: [Segment], horizontal: bool) -> AxisArrays:
+    rows = [(s.y1, min(s.x1, s.x2), max(s.x1, s.x2), s.x1, s.steps, n) if horizontal else
+            (s.x1, min(s.y1, s.y2), max(s.y1, s.y2), s.y1, s.steps, n)
+            for n, s in enumerate(segments)
+            if (s.y1 == s.y2) == horizontal and (s.x1, s.y1) != (s.x2, s.y2)]
+    columns = np.array(rows, dtype=np.int64).reshape(-1, 6).T
+    return AxisArrays(*columns)
+
+
+class WireSet:
+    """
+    Many wires stored as NumPy arrays of segments, for finding where every pair of them cross
+    """
+
+    def __init__(self, wires):
+        self.segments = [to_segments(w) for w in wires]
+        self.horizontal = [axis_arrays(s, True) for s in self.segments]
+        self.vertical = [axis_arrays(s, False) for s in self.segments]
+
+    def __len__(self):
+        return len(self.segments)
+
+    @staticmethod
+    def perpendicular(h: AxisArrays, v: AxisArrays) -> (np.ndarray, np.ndarray, np.ndarray):
+        """
+        Where horizontal segments h cross vertical segments v, tested a chunk of h at a time
+        """
+        xs, ys, steps = [], [], []
+        rows = max(1, CHUNK_SIZE // max(1, len(v.fixed)))
+        for start in range(0, len(h.fixed), rows):
+            chunk = slice(start, start + rows)
+            hy, hlo, hhi = h.fixed[chunk, None], h.lo[chunk, None], h.hi[chunk, None]
+            crossing = (hlo <= v.fixed) & (v.fixed <= hhi) & (v.lo <= hy) & (hy <= v.hi)
+            hn, vn = np.nonzero(crossing)
+            hn += start
+            x, y = v.fixed[vn], h.fixed[hn]
+            xs.append(x)
+            ys.append(y)
+            steps.append(h.steps[hn] + np.abs(x - h.start[hn]) + v.steps[vn] + np.abs(y - v.start[vn]))
+        if not xs:
+            return (np.empty(0, dtype=np.int64),) * 3
+        return np.concatenate(xs), np.concatenate(ys), np.concatenate(steps)
+
+    def parallel(self, i: int, j: int, horizontal: bool) -> [Crossing]:
+        """
+        Where segments of wires i and j overlap along the same line, tested a chunk of wire i's segments at a time
+        """
+        axis = self.horizontal if horizontal else self.vertical
+        a, b = axis[i], axis[j]
+        found = []
+        rows = max(1, CHUNK_SIZE // max(1, len(b.fixed)))
+        for start in range(0, len(a.fixed), rows):
+            chunk = slice(start, start + rows)
+            afixed, alo, ahi = a.fixed[chunk, None], a.lo[chunk, None], a.hi[chunk, None]
+            same_line = (afixed == b.fixed) & (alo <= b.hi) & (b.lo <= ahi)
+            found += [c for an, bn in zip(*np.nonzero(same_line))
+                      for c in overlaps(self.segments[i][a.index[start + an]], self.segments[j][b.index[bn]])]
+        return found
+
+    def crossings(self, i: int, j: int) -> PairCrossings:
+        found = [self.perpendicular(self.horizontal[i], self.vertical[j]),
+                 self.perpendicular(self.horizontal[j], self.vertical[i])]
+        overlapping = self.parallel(i, j, True) + self.parallel(i, j, False)
+        if overlapping:
+            found.append(tuple(np.array(c, dtype=np.int64) for c in zip(*((x, y, s) for (x, y), s in overlapping))))
+        xs, ys, steps = (np.concatenate(c) for c in zip(*found))
+        not_origin = (xs != 0) | (ys != 0)
+        return PairCrossings(i, j, np.stack([xs, ys], axis=1)[not_origin], steps[not_origin])
+
+    def all_crossings(self) -> Iterator[PairCrossings]:
+        """
+        The crossings of every pair of wires, one pair at a time so only one pair's results are held at once
+        """
+        for i, j in combinations(range(len(self)), 2):
+            yield self.crossings(i, j)
+
+
 def answer_1(w1, w2):
-    uw1 = unravel(w1)
-    uw2 = unravel(w2)
-    cross_points = list(uw1.intersection(uw2))
-    cross_points.sort(key=manhattan)
-    print('Answer 1: %s' % manhattan(cross_points[1]))
+    print('Answer 1: %s' % closest_crossing(w1, w2))
 
 
 def answer_2(w1, w2):
-    uw1 = unravel_2(w1)
-    uw2 = unravel_2(w2)
-    cross_points = set(uw1.keys()).intersection(set(uw2.keys()))
-    cross_points = [(point, uw1.get(point) + uw2.get(point)) for point in cross_points]
-    cross_points.sort(key=lambda d: d[1])
-    return cross_points[1]
+    return fewest_steps(w1, w2)
+
+
+def test_wire_set(monkeypatch):
+    wires = [parse_wire(w) for pair in TEST_INPUT_2 for w in pair[:2]] + [parse_wire('L100,U100'), parse_wire('U1')]
+    wire_set = WireSet(wires)
+    pairs = list(wire_set.all_crossings())
+    assert 15 == len(pairs)
+    for c in pairs:
+        expected = {}
+        for (point, steps) in segment_crossings(wires[c.i], wires[c.j]):
+            if point != (0, 0):
+                expected[point] = min(steps, expected.get(point, steps))
+        found = {}
+        for point, steps in zip(map(tuple, c.points.tolist()), c.steps.tolist()):
+            found[point] = min(steps, found.get(point, steps))
+        assert expected == found
+    assert 610 == pairs[0].steps.min()
+    assert 410 == next(c for c in pairs if (c.i, c.j) == (2, 3)).steps.min()
+    # Chunks of a single segment find the same crossings
+    monkeypatch.setattr(sys.modules[__name__], 'CHUNK_SIZE', 1)
+    for c, chunked in zip(pairs, wire_set.all_crossings()):
+        assert c.points.tolist() == chunked.points.tolist() and c.steps.tolist() == chunked.steps.tolist()
+
+
+def test_segment_crossings():
+    for (s1, s2, steps) in TEST_INPUT_2:
+        w1, w2 = parse_wire(s1), parse_wire(s2)
+        uw1, uw2 = unravel_2(w1), unravel_2(w2)
+        expected = {p: uw1[p] + uw2[p] for p in set(uw1).intersection(uw2) if p != (0, 0)}
+        assert min(map(manhattan, expected)) == closest_crossing(w1, w2)
+        assert steps == min(expected.values()) == answer_2(w1, w2).steps
+    # Wires running along each other, and segments far longer than the grid ever expanded
+    w1, w2 = parse_wire('R5,U2'), parse_wire('U1,R2,D1,R6')
+    assert 2 == closest_crossing(w1, w2)
+    assert 6 == fewest_steps(w1, w2).steps
+    w1, w2 = parse_wire('U1000000,R1000000'), parse_wire('R500000,U2000000')
+    assert 1500000 == closest_crossing(w1, w2)
+    assert 3000000 == fewest_steps(w1, w2).steps
+
 
 def main():
-    with open('input.txt') as f:
-        s = f.readlines()
-        w1 = parse_wire(s[0])
-        w2 = parse_wire(s[1])
-        answer_1(w1, w2)
-        print('Answer 2 T1: %s: %s' % answer_2(parse_wire(TEST_INPUT_2[0][0]), parse_wire(TEST_INPUT_2[0][1])))
-        print('Answer 2 T2: %s: %s' % answer_2(parse_wire(TEST_INPUT_2[1][0]), parse_wire(TEST_INPUT_2[1][1])))
-        print('Answer 2: %s: %s' % answer_2(w1, w2))
+    s = read_lines(__file__)
+    w1 = parse_wire(s[0])
+    w2 = parse_wire(s[1])
+    answer_1(w1, w2)
+    print('Answer 2 T1: %s: %s' % answer_2(parse_wire(TEST_INPUT_2[0][0]), parse_wire(TEST_INPUT_2[0][1])))
+    print('Answer 2 T2: %s: %s' % answer_2(parse_wire(TEST_INPUT_2[1][0]), parse_wire(TEST_INPUT_2[1][1])))
+    print('Answer 2: %s: %s' % answer_2(w1, w2))
 
 
 if __name__ == '__main__':
@@ -1,5 +1,16 @@
+from functools import lru_cache
+from math import comb
+from typing import Iterator
+
 INPUT = '134564-585159'
 
+# Whether a run of equal digits of this length satisfies the double digit rule of each part.
+# Runs are only tracked up to length 3, which stands for 3 or more.
+RUN_RULES = {
+    1: lambda run: run >= 2,
+    2: lambda run: run == 2
+}
+
 
 def has_double(p):
     a = p[0]
@@ -44,16 +55,118 @@ def valid_2(pint):
     return len(pstr) == 6 and has_double_2(pstr) and never_decreases(pstr)
 
 
+def after(digit: int, prev: int, run: int, ok: bool, part: int) -> (int, bool):
+    """
+    The run length and whether the rule is met, after appending digit to a sequence ending in a run of prev
+    """
+    if digit == prev:
+        return min(run + 1, 3), ok
+    return 1, ok or RUN_RULES[part](run)
+
+
+@lru_cache(maxsize=None)
+def completions(remaining: int, prev: int, run: int, ok: bool, part: int) -> int:
+    """
+    How many ways there are to append remaining digits, none less than prev, and meet the rule by the end
+    """
+    if remaining == 0:
+        return int(ok or RUN_RULES[part](run))
+    return sum(completions(remaining - 1, d, *after(d, prev, run, ok, part), part) for d in range(prev, 10))
+
+
+def count_up_to(n: int, part: int) -> int:
+    """
+    How many passwords there are from 1 to n
+    """
+    if n < 1:
+        return 0
+    digits = list(map(int, str(n)))
+    # Shorter passwords, a non-decreasing number can't have a zero after its first digit
+    total = sum(completions(length - 1, d, 1, False, part) for length in range(1, len(digits)) for d in range(1, 10))
+    # Passwords as long as n, counted for each digit below n's at the first place they differ
+    prev, run, ok = 1, 0, False
+    for i, digit in enumerate(digits):
+        for d in range(max(prev, 1), digit):
+            total += completions(len(digits) - i - 1, d, *after(d, prev, run, ok, part), part)
+        if digit < prev:
+            return total
+        run, ok = after(digit, prev, run, ok, part) if i else (1, False)
+        prev = digit
+    return total + int(ok or RUN_RULES[part](run))
+
+
+def clamp_to_length(lb: int, ub: int, length: int = None) -> (int, int):
+    if length is None:
+        return lb, ub
+    return max(lb, 10 ** (length - 1)), min(ub, 10 ** length - 1)
+
+
+def count_passwords(lb: int, ub: int, part: int, length: int = None) -> int:
+    """
+    Counts the passwords from lb to ub with never decreasing digits that meet the part's double digit rule,
+    without looking at each number. If length is given, only passwords of that many digits count.
+    """
+    lb, ub = clamp_to_length(lb, ub, length)
+    if lb > ub:
+        return 0
+    return count_up_to(ub, part) - count_up_to(lb - 1, part)
+
+
+def passwords(lb: int, ub: int, part: int, length: int = None) -> Iterator[int]:
+    """
+    Lazily yields the passwords counted by count_passwords in ascending order.
+    Only never decreasing digit sequences are generated, and a prefix is skipped once it can't be completed.
+    """
+    lb, ub = clamp_to_length(lb, ub, length)
+    lb = max(lb, 1)
+    for size in range(len(str(lb)), len(str(ub)) + 1):
+        low = list(map(int, str(lb))) if size == len(str(lb)) else [1] + [0] * (size - 1)
+        high = list(map(int, str(ub))) if size == len(str(ub)) else [9] * size
+
+        def extend(prefix: [int], prev: int, run: int, ok: bool, low_tight: bool, high_tight: bool):
+            i = len(prefix)
+            if i == size:
+                if ok or RUN_RULES[part](run):
+                    yield int(''.join(map(str, prefix)))
+                return
+            start = max(prev, low[i] if low_tight else 0, 1)
+            end = high[i] if high_tight else 9
+            for d in range(start, end + 1):
+                next_run, next_ok = after(d, prev, run, ok, part) if i else (1, False)
+                if completions(size - i - 1, d, next_run, next_ok, part) == 0:
+                    continue
+                yield from extend(prefix + [d], d, next_run, next_ok,
+                                  low_tight and d == low[i], high_tight and d == high[i])
+
+        yield from extend([], 0, 0, False, True, True)
+
+
 def answer_1():
     lb, ub = map(int, INPUT.split('-'))
-    passwords = list(filter(valid_1, range(lb, ub + 1)))
-    print('Answer 1: %s' % len(passwords))
+    print('Answer 1: %s' % count_passwords(lb, ub, 1, length=6))
 
 
 def answer_2():
     lb, ub = map(int, INPUT.split('-'))
-    passwords = list(filter(valid_2, range(lb, ub + 1)))
-    print('Answer 2: %s' % len(passwords))
+    print('Answer 2: %s' % count_passwords(lb, ub, 2, length=6))
+
+
+def test_count_passwords():
+    valid = {1: valid_1, 2: valid_2}
+    for lb, ub in [(134564, 585159), (111111, 111122), (123456, 123455), (345678, 346000)]:
+        for part in (1, 2):
+            expected = [p for p in range(lb, ub + 1) if valid[part](p)]
+            assert len(expected) == count_passwords(lb, ub, part, length=6)
+            assert expected == list(passwords(lb, ub, part, length=6))
+    # Any length and bounds
+    for part, rule in ((1, has_double), (2, has_double_2)):
+        expected = [p for p in range(1, 3000) if rule(str(p)) and never_decreases(str(p))]
+        assert expected == list(passwords(1, 2999, part))
+        assert len(expected) == count_passwords(1, 2999, part)
+    assert 2 == count_passwords(11, 22, 1)
+    # 16 digits drawn from 1 to 9 can't all differ, so every never decreasing one has a double
+    assert comb(24, 16) == count_passwords(0, 10 ** 17, 1, length=16)
+    assert 1111111111111111 == next(passwords(10 ** 15, 10 ** 16, 1))
 
 
 def test_2():
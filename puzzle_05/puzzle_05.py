@@ -1,11 +1,9 @@
+from util.inputs import read_shared_tape
 from util.intcode import run
 
 
 def answer():
-    with open('input.txt') as f:
-        s = f.readline()
-        tape = list(map(int, s.split(',')))
-        run(tape)
+    run(read_shared_tape(__file__))
 
 
 if __name__ == '__main__':
@@ -1,3 +1,8 @@
+from itertools import islice
+from typing import Iterable, Iterator
+
+import numpy as np
+
 TEST_INPUT_1 = ['COM)B', 'B)C', 'C)D', 'D)E', 'E)F', 'B)G', 'G)H', 'D)I', 'E)J', 'J)K', 'K)L']
 TEST_INPUT_2 = ['COM)B'
     , 'B)C'
@@ -14,12 +19,95 @@ TEST_INPUT_2 = ['COM)B'
     , 'I)SAN']
 
 
+class AncestorIndex:
+    """
+    Binary lifting over an OrbitMap, answering lowest common ancestor queries in O(log n).
+    up[k][i] is the 2^k-th center out from object i, with the root as its own center.
+    """
+
+    def __init__(self, orbit_map: {str: str}):
+        centers = set(orbit_map.values()) - set(orbit_map)
+        self.names = sorted(centers) + sorted(orbit_map)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        parent = np.arange(len(self.names), dtype=np.int64)
+        for obj, center in orbit_map.items():
+            parent[self.ids[obj]] = self.ids[center]
+
+        # Depths found by following each object out to the first one whose depth is already known
+        depth = np.full(len(self.names), -1, dtype=np.int64)
+        depth[:len(centers)] = 0
+        for i in range(len(self.names)):
+            path = []
+            while depth[i] < 0:
+                path.append(i)
+                i = parent[i]
+            for j in reversed(path):
+                depth[j] = depth[i] + 1
+                i = j
+        self.depth = depth
+
+        self.up = [parent]
+        for _ in range(max(1, int(depth.max()).bit_length())):
+            self.up.append(self.up[-1][self.up[-1]])
+        self.up = np.stack(self.up)
+        # Python lists are quicker to index one object at a time
+        self.depth_list = depth.tolist()
+        self.up_lists = self.up.tolist()
+
+    def lowest_common_ancestor(self, a: int, b: int) -> int:
+        """
+        The deepest object both a and b orbit, directly or indirectly, or either one if it orbits the other
+        """
+        depth, up = self.depth_list, self.up_lists
+        names = self.names[a], self.names[b]
+        if depth[a] < depth[b]:
+            a, b = b, a
+        diff = depth[a] - depth[b]
+        k = 0
+        while diff:
+            if diff & 1:
+                a = up[k][a]
+            diff >>= 1
+            k += 1
+        if a == b:
+            return a
+        for k in reversed(range(len(up))):
+            if up[k][a] != up[k][b]:
+                a, b = up[k][a], up[k][b]
+        if up[0][a] != up[0][b]:
+            raise ValueError('%s and %s don\'t share a center' % names)
+        return up[0][a]
+
+    def lowest_common_ancestors(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """
+        lowest_common_ancestor for arrays of pairs at once, -1 for pairs that don't share a center
+        """
+        a, b = a.copy(), b.copy()
+        swap = self.depth[a] < self.depth[b]
+        a[swap], b[swap] = b[swap], a[swap]
+        diff = self.depth[a] - self.depth[b]
+        for k in range(len(self.up)):
+            lift = (diff >> k) & 1 == 1
+            a[lift] = self.up[k][a[lift]]
+        for k in reversed(range(len(self.up))):
+            ua, ub = self.up[k][a], self.up[k][b]
+            differ = ua != ub
+            a[differ], b[differ] = ua[differ], ub[differ]
+        lca = np.where(a == b, a, self.up[0][a])
+        lca[self.up[0][a] != self.up[0][b]] = -1
+        return lca
+
+
 class OrbitMap:
+    # How many pairs transfer_distances works on at once
+    CHUNK_SIZE = 1 << 16
+
     def __init__(self, orbit_map):
         # A map of objects to their center
         self.orbit_map: dict[str, str] = orbit_map
         # A map of orbits to their orbit count
         self.orbit_counts: dict[str, int] = {'COM': 0}
+        self.__index = None
 
     def count_all_orbits(self):
         count = 0
@@ -58,6 +146,52 @@ class OrbitMap:
         join = p1 + list(reversed(p2[:-1]))
         return join
 
+    # Built on first use, then shared by every query
+    def ancestor_index(self) -> AncestorIndex:
+        if self.__index is None:
+            self.__index = AncestorIndex(self.orbit_map)
+        return self.__index
+
+    def lowest_common_ancestor(self, obj1, obj2) -> str:
+        index = self.ancestor_index()
+        return index.names[index.lowest_common_ancestor(index.ids[obj1], index.ids[obj2])]
+
+    # The orbital transfers to move from orbiting obj1's center to orbiting obj2's center
+    def transfer_distance(self, obj1, obj2) -> int:
+        index = self.ancestor_index()
+        depth, parent = index.depth_list, index.up_lists[0]
+        for obj in (obj1, obj2):
+            if obj not in self.orbit_map:
+                raise ValueError('%s doesn\'t orbit anything' % obj)
+        a, b = parent[index.ids[obj1]], parent[index.ids[obj2]]
+        return depth[a] + depth[b] - 2 * depth[index.lowest_common_ancestor(a, b)]
+
+    # transfer_distance for each pair, worked out a chunk of pairs at a time
+    def transfer_distances(self, pairs: Iterable[tuple]) -> Iterator[int]:
+        index = self.ancestor_index()
+        pairs = iter(pairs)
+        while True:
+            chunk = list(islice(pairs, self.CHUNK_SIZE))
+            if not chunk:
+                return
+            objs = np.fromiter((index.ids[obj] for p in chunk for obj in p[:2]), dtype=np.int64, count=2 * len(chunk))
+            # The centers of each pair, an object orbiting nothing is its own
+            centers = index.up[0][objs]
+            if (centers == objs).any():
+                i = int(np.argmax(centers == objs))
+                raise ValueError('%s doesn\'t orbit anything' % chunk[i // 2][i % 2])
+            a, b = centers[0::2], centers[1::2]
+            lca = index.lowest_common_ancestors(a, b)
+            if (lca < 0).any():
+                i = int(np.argmax(lca < 0))
+                raise ValueError('%s and %s don\'t share a center' % tuple(chunk[i][:2]))
+            yield from (index.depth[a] + index.depth[b] - 2 * index.depth[lca]).tolist()
+
+    # transfer_distances for a file of pairs, one 'A B' pair per line, read as it's needed
+    def transfer_distances_from_file(self, path) -> Iterator[int]:
+        with open(path) as f:
+            yield from self.transfer_distances(line.split() for line in f if line.strip())
+
 
 def parse_line(line): return tuple(reversed(line.split(')')))
 
@@ -91,9 +225,49 @@ def answer_2():
     with open('input.txt') as f:
         s = map(str.strip, f.readlines())
         m = parse(s)
-        p = m.path_objects('YOU', 'SAN')
-        c = len(p) - 1
-        print(c)
+        print(m.transfer_distance('YOU', 'SAN'))
+
+
+def test_transfer_distance(tmp_path):
+    m = parse(TEST_INPUT_2)
+    assert 4 == len(m.path_objects('YOU', 'SAN')) - 1 == m.transfer_distance('YOU', 'SAN')
+    assert 'D' == m.lowest_common_ancestor('YOU', 'SAN')
+    assert 'B' == m.lowest_common_ancestor('H', 'B')
+    # Every pair, checked against a breadth first search between their centers
+    neighbours = {}
+    for obj, center in m.orbit_map.items():
+        neighbours.setdefault(obj, []).append(center)
+        neighbours.setdefault(center, []).append(obj)
+
+    def search(start, end):
+        distances = {start: 0}
+        pending = [start]
+        for obj in pending:
+            for n in neighbours[obj]:
+                if n not in distances:
+                    distances[n] = distances[obj] + 1
+                    pending.append(n)
+        return distances[end]
+
+    objects = sorted(m.orbit_map)
+    pairs = [(a, b) for a in objects for b in objects]
+    expected = [search(m.orbit_map[a], m.orbit_map[b]) for a, b in pairs]
+    assert expected == [m.transfer_distance(a, b) for a, b in pairs]
+    assert 1 == m.transfer_distance('B', 'C') and 0 == m.transfer_distance('B', 'B')
+    path = tmp_path / 'pairs.txt'
+    path.write_text(''.join('%s %s\n' % p for p in pairs))
+    m.CHUNK_SIZE = 7
+    assert expected == list(m.transfer_distances(pairs)) == list(m.transfer_distances_from_file(path))
+    # A long chain, deeper than the recursion limit
+    chain = OrbitMap({str(i): str(i - 1) if i else 'COM' for i in range(5000)})
+    assert 4999 == chain.transfer_distance('0', '4999')
+    assert '2000' == chain.lowest_common_ancestor('2000', '4000')
+    for transfer in (lambda: m.transfer_distance('COM', 'B'), lambda: list(m.transfer_distances([('B', 'COM')]))):
+        try:
+            transfer()
+            assert False
+        except ValueError as e:
+            assert 'COM' in str(e)
 
 
 if __name__ == '__main__':
@@ -1,41 +1,54 @@
 import itertools
 
-from util.intcode import run_as_function, IntCode, Memory, STATUS_CODES
+from util.inputs import read_shared_tape
+from util.intcode import run_as_function, IntCode, Tape, Channel, parameter_input, Snapshot, FunctionCache
+from util.network import Network
 
 
-def read_tape():
-    with open('input.txt') as f:
-        s = f.readline()
-        tape = list(map(int, s.split(',')))
-    return tape
+def puzzle_tape() -> Tape:
+    return read_shared_tape(__file__)
 
 
-TAPE = read_tape()
+def phase_snapshots(phases: [int], tape=None) -> {int: Snapshot}:
+    """
+    Runs an amplifier for each phase setting up until it reads its input signal
+    """
+    tape = puzzle_tape() if tape is None else tape
+    snapshots = {}
+    for phase in phases:
+        m = IntCode(tape, parameter_input(phase), Channel().store)
+        m.run()
+        snapshots[phase] = m.snapshot()
+    return snapshots
 
 
-def run_amplifiers(config: [int], tape=TAPE):
+def run_amplifiers(config: [int], tape=None, snapshots: {int: Snapshot} = None, function=run_as_function):
+    """
+    :param function: Runs each amplifier, pass a FunctionCache to only run each distinct phase and signal once
+    """
+    tape = puzzle_tape() if tape is None else tape
     v = 0
     for c in config:
-        v = run_as_function(tape, [c, v])[0]
+        if snapshots is None:
+            v = function(tape, [c, v])[0]
+            continue
+        channel = Channel()
+        IntCode.from_snapshot(snapshots[c], parameter_input(v), channel.store).run()
+        v = channel.drain()[-1]
     return v
 
 
-def run_amplifier_loop(config: [int], tape=TAPE):
-    inputs = [Memory() for _ in config]
-    outputs = [mem.store for mem in inputs]
-    machines = []
+def run_amplifier_loop(config: [int], tape=None):
+    tape = puzzle_tape() if tape is None else tape
+    network = Network()
+    for x, phase in enumerate(config):
+        network.add(x, tape)
+        network.send(x, phase)
     for x in range(len(config)):
-        m_in = inputs[x]
-        m_in.store(config[x])
-        m_out = outputs[(x + 1) % len(config)]
-        machines.append(IntCode(tape, m_in, m_out))
-
-    inputs[0].store(0)
-
-    while machines[-1].status != STATUS_CODES.FINISHED:
-        for machine in machines:
-            machine.run()
-    return inputs[0].memory[0]
+        network.connect(x, (x + 1) % len(config))
+    network.send(0, 0)
+    network.run()
+    return network.inbox(0).drain()[-1]
 
 
 def test_1():
@@ -47,14 +60,24 @@ def test_1():
     r = run_amplifiers([1, 0, 4, 3, 2], [3, 31, 3, 32, 1002, 32, 10, 32, 1001, 31, -2, 31, 1007, 31, 0, 33,
                                          1002, 33, 7, 33, 1, 33, 31, 31, 1, 32, 31, 31, 4, 31, 99, 0, 0, 0])
     assert 65210 == r
+    tape = [3, 15, 3, 16, 1002, 16, 10, 16, 1, 16, 15, 15, 4, 15, 99, 0, 0]
+    r = run_amplifiers([4, 3, 2, 1, 0], tape, phase_snapshots(range(5), tape))
+    assert 43210 == r
+    cache = FunctionCache()
+    for _ in range(2):
+        assert 43210 == run_amplifiers([4, 3, 2, 1, 0], tape, function=cache)
+    assert 5 == cache.info().hits
 
 
 def answer():
     configs = itertools.permutations(range(5), 5)
+    # One tape for every run, so its fingerprint is only worked out once
+    tape = puzzle_tape()
+    cache = FunctionCache()
     best_value = None
     best_config = None
     for c in configs:
-        v = run_amplifiers(c)
+        v = run_amplifiers(c, tape, function=cache)
         if best_value is None or v > best_value:
             best_value = v
             best_config = c
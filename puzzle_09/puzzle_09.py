@@ -1,22 +1,14 @@
+from util.inputs import read_shared_tape
 from util.intcode import IntCode, run_as_function
 
 
-def read_tape():
-    with open('input.txt') as f:
-        s = f.readline()
-        return list(map(int, s.split(',')))
-
-
-TAPE = read_tape()
-
-
 def answer_1():
-    r = run_as_function(TAPE, [1])
+    r = run_as_function(read_shared_tape(__file__), [1], jit=True)
     print('Answer 1: %s' % r[0])
 
 
 def answer_2():
-    r = run_as_function(TAPE, [2])
+    r = run_as_function(read_shared_tape(__file__), [2], jit=True)
     print('Answer 2: %s' % r[0])
 
 
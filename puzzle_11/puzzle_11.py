@@ -1,6 +1,7 @@
 from enum import Enum
 
-from util.intcode import IntCode, STATUS_CODES, Memory
+from util.inputs import read_shared_tape
+from util.intcode import IntCode, STATUS_CODES
 
 
 class Panel:
@@ -59,17 +60,12 @@ class Robot:
     coord: (int, int)
     brain: IntCode
     panel: Panel
-    memory: Memory
 
     def __init__(self, coord, panel: Panel):
         self.panel = panel
         self.direction = Robot.DIRECTION.UP
         self.coord = coord
-        self.memory = Memory()
-        with open('input.txt') as f:
-            s = f.readline()
-            tape = list(map(int, s.split(',')))
-        self.brain = IntCode(tape, self.__brain_input(), self.__brain_output)
+        self.brain = IntCode(read_shared_tape(__file__), self.__brain_input(), self.__brain_output, jit=True, frame=2)
 
     def run(self):
         self.brain.run()
@@ -113,11 +109,8 @@ class Robot:
             Robot.DIRECTION.LEFT: Robot.DIRECTION.UP
         }[self.direction]
 
-    def __brain_output(self, v):
-        self.memory.store(v)
-        assert len(self.memory.memory) <= 2
-        if len(self.memory.memory) == 2:
-            self.act(*list(self.memory))
+    def __brain_output(self, frame: (int, int)):
+        self.act(*frame)
 
     def __brain_input(self):
         while True:
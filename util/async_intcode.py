@@ -0,0 +1,81 @@
+import asyncio
+
+from util.intcode import IntCode, STATUS_CODES, PAUSE_CODES
+
+
+class AsyncIntCode(IntCode):
+    """
+    An IntCode machine for asyncio, which awaits its input and output rather than pausing.
+    - stdin is read with 'await stdin.get()' and stdout written with 'await stdout.put(v)', as with an asyncio.Queue
+    - The machine only gives up the event loop while awaiting one of these
+    """
+
+    def __init__(self, tape: [int], stdin: asyncio.Queue, stdout: asyncio.Queue, jit: bool = False):
+        super().__init__(tape, stdin, stdout, jit)
+
+    async def run(self):
+        self.status = STATUS_CODES.RUNNING
+        tape = self.tape
+        blocks = tape.blocks
+        instructions = tape.instructions
+        while True:
+            if self.jit:
+                block = blocks.get(self.position)
+                if block is None and self.position not in tape.modified:
+                    block = self.compile(self.position)
+                if block is not None:
+                    self.position = block(tape)
+                    continue
+
+            decoded = instructions.get(self.position)
+            if decoded is None:
+                decoded = self.decode(self.position)
+            (op_code, param_count, op, param_modes) = decoded
+            if op_code == 99:
+                self.status = STATUS_CODES.FINISHED
+                return
+
+            raw_params = tape[self.position + 1:self.position + param_count + 1]
+            params = list(zip(param_modes, raw_params))
+            if op_code == 3:
+                self.status = STATUS_CODES.PAUSED
+                self.pause_code = PAUSE_CODES.READING
+                value = await self.stdin.get()
+                self.status = STATUS_CODES.RUNNING
+                self.pause_code = None
+                tape[params[0]] = value
+            elif op_code == 4:
+                await self.stdout.put(tape[params[0]])
+            else:
+                self.position += param_count + 1
+                op(params)
+                continue
+            self.position += param_count + 1
+
+
+async def run_ring(tape: [int], first_inputs: [[int]]) -> asyncio.Queue:
+    """
+    Runs a machine per element of first_inputs, each feeding its output into the next and the last into the first.
+    Returns the first machine's input queue once every machine has finished.
+    """
+    channels = [asyncio.Queue() for _ in first_inputs]
+    for channel, values in zip(channels, first_inputs):
+        for v in values:
+            channel.put_nowait(v)
+    machines = [AsyncIntCode(tape, channels[x], channels[(x + 1) % len(channels)]) for x in range(len(channels))]
+    await asyncio.gather(*(m.run() for m in machines))
+    return channels[0]
+
+
+def test_ring():
+    tape = [3, 26, 1001, 26, -4, 26, 3, 27, 1002, 27, 2, 27, 1, 27, 26,
+            27, 4, 27, 1001, 28, -1, 28, 1005, 28, 6, 99, 0, 0, 5]
+    r = asyncio.run(run_ring(tape, [[9, 0], [8], [7], [6], [5]]))
+    assert 139629729 == r.get_nowait()
+
+
+def test_many_machines():
+    # Each machine adds 1 to the value it's passed, around a ring of 500 machines
+    tape = [3, 9, 1001, 9, 1, 9, 4, 9, 99, 0]
+    r = asyncio.run(run_ring(tape, [[0]] + [[]] * 499))
+    assert 500 == r.get_nowait()
@@ -0,0 +1,200 @@
+import numpy as np
+
+from util.intcode import IntCode, parameter_input
+
+# The state of each lane, SCALAR lanes have left the batch for an IntCode machine
+RUNNING, FINISHED, SCALAR = range(3)
+
+PARAM_COUNTS = {1: 3, 2: 3, 3: 1, 4: 1, 5: 2, 6: 2, 7: 3, 8: 3, 9: 1, 99: 0}
+
+INT64_MIN = np.iinfo(np.int64).min
+
+
+class BatchIntCode:
+    """
+    Runs many copies of the same program in lockstep, one lane per copy.
+    - Memory is a lanes x addresses int64 matrix, with a position and relative base per lane
+    - Each step executes one instruction in every running lane, grouping lanes by op code
+    - A lane that addresses outside of its memory, overflows an int64 or runs out of input carries on
+      in an IntCode machine instead, as does every lane once fewer than min_lanes are left running
+    """
+
+    def __init__(self, tape: [int], inputs: [[int]], size: int = None, min_lanes: int = 8):
+        lane_count = len(inputs)
+        self.size = size or max(2 * len(tape), 1024)
+        self.min_lanes = min_lanes
+        # Padded so that parameters of an instruction at the end of memory can still be fetched
+        self.memory = np.zeros((lane_count, self.size + 4), dtype=np.int64)
+        self.position = np.zeros(lane_count, dtype=np.int64)
+        self.relative_base = np.zeros(lane_count, dtype=np.int64)
+        self.state = np.full(lane_count, RUNNING)
+        self.inputs = [list(i) for i in inputs]
+        self.input_position = np.zeros(lane_count, dtype=np.int64)
+        self.outputs = [[] for _ in range(lane_count)]
+        # The IntCode machines of any lanes that have left the batch
+        self.machines = {}
+        try:
+            self.memory[:, :len(tape)] = tape
+        except OverflowError:
+            self.drop(range(lane_count), tape)
+
+    def patch(self, address: int, values: [int]):
+        """
+        Writes a value per lane into address before the batch is run
+        """
+        self.memory[:, address] = values
+
+    def cell(self, address: int) -> [int]:
+        """
+        Reads address from every lane
+        """
+        values = self.memory[:, address].tolist()
+        for lane, machine in self.machines.items():
+            values[lane] = machine.tape[address]
+        return values
+
+    def drop(self, lanes, tape: [int] = None):
+        """
+        Moves lanes out of the batch and into their own IntCode machine, from the instruction they're at
+        """
+        for lane in lanes:
+            lane = int(lane)
+            machine = IntCode(self.memory[lane, :self.size].tolist() if tape is None else tape,
+                              parameter_input(*self.inputs[lane][self.input_position[lane]:]),
+                              self.outputs[lane].append)
+            machine.position = int(self.position[lane])
+            machine.tape.relative_base = int(self.relative_base[lane])
+            self.machines[lane] = machine
+            self.state[lane] = SCALAR
+
+    def run(self):
+        lanes = np.flatnonzero(self.state == RUNNING)
+        while len(lanes) >= self.min_lanes:
+            self.step(lanes)
+            lanes = np.flatnonzero(self.state == RUNNING)
+        self.drop(lanes)
+        for machine in self.machines.values():
+            machine.run()
+
+    def step(self, lanes: np.ndarray):
+        position = self.position[lanes]
+        outside = (position < 0) | (position >= self.size)
+        if outside.any():
+            self.drop(lanes[outside])
+            lanes, position = lanes[~outside], position[~outside]
+        instr = self.memory[lanes, position]
+        op_codes = instr % 100
+        for op_code in np.unique(op_codes).tolist():
+            group = op_codes == op_code
+            if op_code not in PARAM_COUNTS:
+                # Let IntCode raise for the unknown op code
+                self.drop(lanes[group])
+                continue
+            self.execute(op_code, lanes[group], instr[group], position[group])
+
+    def execute(self, op_code: int, lanes: np.ndarray, instr: np.ndarray, position: np.ndarray):
+        if op_code == 99:
+            self.state[lanes] = FINISHED
+            return
+        param_count = PARAM_COUNTS[op_code]
+        writes = op_code in (1, 2, 3, 7, 8)
+
+        # Resolve every parameter's address, lanes with one out of bounds leave the batch
+        modes, raws, addresses = [], [], []
+        invalid = np.zeros(len(lanes), dtype=bool)
+        for i in range(param_count):
+            mode = instr // 10 ** (i + 2) % 10
+            raw = self.memory[lanes, position + i + 1]
+            address = np.where(mode == 2, self.relative_base[lanes] + raw, raw)
+            invalid |= (mode != 1) & ((address < 0) | (address >= self.size))
+            if writes and i == param_count - 1:
+                invalid |= mode == 1
+            modes.append(mode)
+            raws.append(raw)
+            addresses.append(address)
+        if op_code == 3:
+            invalid |= self.input_position[lanes] >= np.array([len(self.inputs[lane]) for lane in lanes.tolist()],
+                                                              dtype=np.int64)
+        if invalid.any():
+            self.drop(lanes[invalid])
+            valid = ~invalid
+            lanes, position = lanes[valid], position[valid]
+            modes = [m[valid] for m in modes]
+            raws = [r[valid] for r in raws]
+            addresses = [a[valid] for a in addresses]
+
+        def read(i):
+            return np.where(modes[i] == 1, raws[i], self.memory[lanes, np.where(modes[i] == 1, 0, addresses[i])])
+
+        next_position = position + param_count + 1
+        if op_code in (1, 2, 7, 8):
+            a, b = read(0), read(1)
+            if op_code == 1:
+                value = a + b
+                overflow = ((a ^ value) & (b ^ value)) < 0
+            elif op_code == 2:
+                value = a * b
+                overflow = (value // np.where(a == 0, 1, a) != b) & (a != 0)
+                overflow |= (a == -1) & (b == INT64_MIN)
+            elif op_code == 7:
+                value, overflow = (a < b).astype(np.int64), None
+            else:
+                value, overflow = (a == b).astype(np.int64), None
+            if overflow is not None and overflow.any():
+                # Leave the batch before the instruction, so that IntCode can execute it with python ints
+                self.drop(lanes[overflow])
+                fits = ~overflow
+                lanes, value, next_position = lanes[fits], value[fits], next_position[fits]
+                addresses[2] = addresses[2][fits]
+            self.memory[lanes, addresses[2]] = value
+        elif op_code == 3:
+            values = [self.inputs[lane][self.input_position[lane]] for lane in lanes.tolist()]
+            self.memory[lanes, addresses[0]] = values
+            self.input_position[lanes] += 1
+        elif op_code == 4:
+            for lane, value in zip(lanes.tolist(), read(0).tolist()):
+                self.outputs[lane].append(value)
+        elif op_code in (5, 6):
+            condition, target = read(0), read(1)
+            jump = condition != 0 if op_code == 5 else condition == 0
+            next_position = np.where(jump, target, next_position)
+        elif op_code == 9:
+            self.relative_base[lanes] += read(0)
+        self.position[lanes] = next_position
+
+
+def run_batch(tape: [int], parameters: [[int]]) -> [[int]]:
+    """
+    The equivalent of calling run_as_function(tape, p) for each p in parameters
+    """
+    batch = BatchIntCode(tape, parameters)
+    batch.run()
+    return [list(reversed(outputs)) for outputs in batch.outputs]
+
+
+def test_run_batch():
+    from util.intcode import run_as_function
+    tape = [3, 9, 8, 9, 10, 9, 4, 9, 99, -1, 8]
+    assert [[0], [1], [0]] * 4 == run_batch(tape, [[7], [8], [9]] * 4)
+    tape = [109, 1, 204, -1, 1001, 100, 1, 100, 1008, 100, 16, 101, 1006, 101, 0, 99]
+    assert [run_as_function(tape, [])] * 10 == run_batch(tape, [[]] * 10)
+    # Squares its input, overflowing an int64 for the larger inputs
+    tape = [3, 9, 2, 9, 9, 9, 4, 9, 99, 0]
+    inputs = [[v] for v in range(0, 2 ** 40, 2 ** 30)]
+    assert [[v * v] for (v,) in inputs] == run_batch(tape, inputs)
+    # Reads two inputs, but some lanes are only given one
+    tape = [3, 11, 3, 12, 1, 11, 12, 13, 4, 13, 99, 0, 0, 0]
+    inputs = [[v, v] if v % 2 else [v] for v in range(20)]
+    batch = BatchIntCode(tape, inputs)
+    batch.run()
+    assert [[2 * v] if v % 2 else [] for v in range(20)] == batch.outputs
+    assert {v for v in range(20) if v % 2 == 0} == set(batch.machines)
+
+
+def test_patch():
+    tape = [1, 0, 0, 0, 99, 5, 6]
+    batch = BatchIntCode(tape, [[]] * 9)
+    batch.patch(1, [5, 6, 0] * 3)
+    batch.patch(2, [5, 5, 5, 6, 6, 6, 0, 0, 0])
+    batch.run()
+    assert [10, 11, 6, 11, 12, 7, 6, 7, 2] == batch.cell(0)
@@ -0,0 +1,239 @@
+"""
+Benchmarks the IntCode interpreter against a fixed corpus of programs.
+
+    python -m util.benchmark [--output results.json] [--baseline util/benchmark_baseline.json]
+
+Each benchmark records its best time over --repeat runs, and its peak memory from one more run under tracemalloc.
+Times are also recorded relative to a calibration loop of plain Python timed alongside each run, so they compare
+across machines, and against a busy machine's own earlier runs. Only the relative times and peak memory are kept in
+the baseline. Any benchmark slower or larger than the baseline by more than --tolerance fails the run.
+--update-baseline overwrites the baseline with these results instead, rerun it whenever the corpus changes.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Callable
+
+from util.inputs import shared_tape
+from util.intcode import IntCode, Channel, Tape, run_as_function, parameter_input
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, 'util', 'benchmark_baseline.json')
+# Differences this small are ignored whatever the tolerance, so the quickest benchmarks aren't flaky
+NOISE = {'relative': 0.25, 'peak_bytes': 4096}
+# What's kept of each result in the baseline, seconds depend on the machine
+BASELINE_KEYS = ('relative', 'peak_bytes')
+# Iterations of the calibration loop, long enough to time reliably
+CALIBRATION_STEPS = 300000
+
+
+def read_tape(day: int) -> Tape:
+    return shared_tape(os.path.join(ROOT, 'puzzle_%02d' % day, 'input.txt'))
+
+
+def calibration_loop(n: int = CALIBRATION_STEPS) -> int:
+    # Indexing, arithmetic and branching, the work an interpreter does, with nothing from this repo
+    cells = list(range(64))
+    total = 0
+    for i in range(n):
+        if cells[i & 63] & 1:
+            total += i
+    return total
+
+
+def tight_loop(n: int) -> [int]:
+    # Counts down from n
+    return [1101, 0, n, 12, 1001, 12, -1, 12, 1005, 12, 4, 99, 0]
+
+
+def relative_base_stack(depth: int) -> [int]:
+    # Pushes depth down to 1 onto a stack addressed through the relative base, then pops and outputs their sum
+    c, s, f = 40, 41, 42
+    return [
+        109, 1000,
+        1101, 0, depth, c,
+        109, 1,
+        21001, c, 0, 0,
+        1001, c, -1, c,
+        1005, c, 6,
+        2001, s, 0, s,
+        109, -1,
+        1001, c, 1, c,
+        1007, c, depth, f,
+        1005, f, 19,
+        4, s,
+        99,
+        0, 0, 0, 0
+    ]
+
+
+def huge_output(n: int) -> [int]:
+    # Outputs 1 to n
+    return [1001, 14, 1, 14, 4, 14, 1007, 14, n, 15, 1005, 15, 0, 99, 0, 0]
+
+
+def run_silently(tape: [int], parameters: [int] = (), jit: bool = False) -> IntCode:
+    m = IntCode(tape, parameter_input(*parameters), Channel().store, jit)
+    m.run()
+    return m
+
+
+def amplifiers(tape: [int], jit: bool = False) -> int:
+    best = None
+    for config in itertools.permutations(range(5)):
+        v = 0
+        for c in config:
+            v = run_as_function(tape, [c, v], jit)[0]
+        best = v if best is None else max(best, v)
+    return best
+
+
+def paint(tape: [int], jit: bool = False) -> int:
+    """
+    The day 11 robot, painting a panel that starts out black
+    """
+    panel = {}
+    position, direction = (0, 0), (0, 1)
+
+    def camera():
+        while True:
+            yield panel.get(position, 0)
+
+    def wheels(frame):
+        nonlocal position, direction
+        colour, turn = frame
+        panel[position] = colour
+        dx, dy = direction
+        direction = (-dy, dx) if turn == 0 else (dy, -dx)
+        position = (position[0] + direction[0], position[1] + direction[1])
+
+    IntCode(tape, camera(), wheels, jit, frame=2).run()
+    return len(panel)
+
+
+def corpus() -> {str: Callable[[], object]}:
+    day_2 = read_tape(2)
+    day_2[1], day_2[2] = 12, 2
+    day_5 = read_tape(5)
+    day_7 = read_tape(7)
+    day_9 = read_tape(9)
+    day_11 = read_tape(11)
+    benchmarks = {}
+    for jit in (False, True):
+        suffix = '_jit' if jit else ''
+        benchmarks.update({
+            'day_02' + suffix: lambda jit=jit: run_silently(day_2, jit=jit).tape[0],
+            'day_05' + suffix: lambda jit=jit: run_as_function(day_5, [5], jit),
+            'day_07' + suffix: lambda jit=jit: amplifiers(day_7, jit),
+            'day_09' + suffix: lambda jit=jit: run_as_function(day_9, [2], jit),
+            'day_11' + suffix: lambda jit=jit: paint(day_11, jit),
+            'tight_loop' + suffix: lambda jit=jit: run_silently(tight_loop(50000), jit=jit),
+            'relative_base_stack' + suffix: lambda jit=jit: run_as_function(relative_base_stack(20000), [], jit),
+            'huge_output' + suffix: lambda jit=jit: run_as_function(huge_output(20000), [], jit)
+        })
+    return benchmarks
+
+
+def timed(f: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    f()
+    return time.perf_counter() - start
+
+
+def measure(benchmark: Callable[[], object], repeat: int) -> dict:
+    """
+    The best time of benchmark over repeat runs, and relative to the best time of the calibration loop run
+    alternately with it, so both see the same load on the machine
+    """
+    seconds = calibration = None
+    for _ in range(repeat):
+        elapsed = timed(calibration_loop)
+        calibration = elapsed if calibration is None else min(calibration, elapsed)
+        elapsed = timed(benchmark)
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+    tracemalloc.start()
+    try:
+        benchmark()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': seconds, 'relative': seconds / calibration, 'peak_bytes': peak}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> [str]:
+    """
+    Lists every measurement in results that's worse than its baseline by more than tolerance
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for key, value in result.items():
+            if key not in BASELINE_KEYS:
+                continue
+            expected = baseline[name].get(key)
+            if expected is not None and value > expected * (1 + tolerance) + NOISE.get(key, 0):
+                regressions.append('%s %s: %.4g vs baseline %.4g (+%.0f%%)'
+                                   % (name, key, value, expected, 100 * (value / expected - 1)))
+    return regressions
+
+
+def main(argv: [str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmarks the IntCode interpreter')
+    parser.add_argument('--output', help='Where to write the results as JSON')
+    parser.add_argument('--baseline', default=BASELINE, help='The results to compare against')
+    parser.add_argument('--update-baseline', action='store_true', help='Overwrite the baseline with these results')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='How much worse than the baseline is allowed')
+    parser.add_argument('--repeat', type=int, default=5, help='How many timed runs of each benchmark')
+    parser.add_argument('names', nargs='*', help='Only run the benchmarks with these names')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, benchmark in corpus().items():
+        if args.names and name not in args.names:
+            continue
+        results[name] = measure(benchmark, args.repeat)
+        print('%-26s %8.4fs %8.2fx %12d bytes' % (name, results[name]['seconds'], results[name]['relative'],
+                                                   results[name]['peak_bytes']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({name: {key: result[key] for key in BASELINE_KEYS} for name, result in results.items()},
+                      f, indent=2)
+        return 0
+    if not os.path.exists(args.baseline):
+        print('No baseline at %s' % args.baseline)
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print('REGRESSION ' + regression, file=sys.stderr)
+    return 1 if regressions else 0
+
+
+def test_programs():
+    assert [sum(range(101))] == run_as_function(relative_base_stack(100), [])
+    assert list(reversed(range(1, 101))) == run_as_function(huge_output(100), [])
+    assert 0 == run_silently(tight_loop(100)).tape[12]
+
+
+def test_compare():
+    baseline = {'a': {'relative': 1.0, 'peak_bytes': 100}, 'b': {'relative': 1.0, 'peak_bytes': 100}}
+    results = {'a': {'seconds': 9.0, 'relative': 1.1, 'peak_bytes': 100},
+               'b': {'seconds': 0.1, 'relative': 2.0, 'peak_bytes': 100}, 'c': {}}
+    regressions = compare(results, baseline, 0.25)
+    # Seconds aren't compared, only the times relative to the calibration loop
+    assert 1 == len(regressions)
+    assert regressions[0].startswith('b relative')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
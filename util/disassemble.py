@@ -0,0 +1,281 @@
+"""
+Disassembles a tape and builds its control flow graph.
+
+    python -m util.disassemble puzzle_09/input.txt [--steps 2]
+
+Code is found by following every path from address 0, so data the program never executes isn't disassembled.
+Jumps whose target is read from the tape can't be followed statically, their blocks are marked indirect.
+"""
+import argparse
+import sys
+from collections import namedtuple
+
+from util.intcode import IntCode, Channel, parameter_input, STATUS_CODES
+from util.profiler import OP_NAMES, WRITE_PARAMS
+
+PARAM_COUNTS = {op_code: count for op_code, (count, _) in IntCode((), parameter_input(), print).OPCODES.items()}
+PARAM_COUNTS[99] = 0
+
+JUMPS = {5, 6}
+
+Instruction = namedtuple('Instruction', 'address op_code params')
+
+
+class Block:
+    """
+    A basic block, a run of instructions only entered at its first and left after its last
+    """
+
+    def __init__(self, start: int):
+        self.start = start
+        self.instructions: [Instruction] = []
+        self.successors: [int] = []
+        # Whether the block ends in a jump to an address read from the tape
+        self.indirect = False
+        # Whether the block ends in an op code that doesn't exist, so the program would crash there
+        self.invalid = False
+
+    @property
+    def end(self) -> int:
+        last = self.instructions[-1] if self.instructions else None
+        return self.start if last is None else last.address + len(last.params) + 1
+
+
+class ControlFlowGraph:
+    """
+    The instructions reachable from address 0, split into blocks
+    - loop_headers are the blocks entered by a jump backwards along some path, where hot loops start
+    - self_modified are addresses of code the program writes to, dynamic_writes the instructions writing through
+      the relative base, which could write anywhere
+    """
+
+    def __init__(self, tape: [int]):
+        self.tape = tape
+        self.instructions: {int: Instruction} = {}
+        self.blocks: {int: Block} = {}
+        self.loop_headers: {int} = set()
+        self.self_modified: {int} = set()
+        self.dynamic_writes: {int} = set()
+        self.invalid: {int} = set()
+        self.__disassemble()
+        self.__build_blocks()
+        self.__find_loops()
+        self.__find_writes()
+
+    def decode(self, address: int):
+        instr = self.tape[address] if address < len(self.tape) else 0
+        op_code = instr % 100
+        if op_code not in PARAM_COUNTS:
+            return None
+        count = PARAM_COUNTS[op_code]
+        modes = [instr // 10 ** (i + 2) % 10 for i in range(count)]
+        if any(m > 2 for m in modes) or instr // 10 ** (count + 2) != 0:
+            return None
+        if WRITE_PARAMS.get(op_code) is not None and modes[WRITE_PARAMS[op_code]] == 1:
+            return None
+        raw = [self.tape[a] if a < len(self.tape) else 0 for a in range(address + 1, address + count + 1)]
+        return Instruction(address, op_code, list(zip(modes, raw)))
+
+    def successors(self, instr: Instruction) -> ([int], bool):
+        """
+        Returns the addresses execution can continue at after instr, and whether it may also jump somewhere unknown
+        """
+        next_address = instr.address + len(instr.params) + 1
+        if instr.op_code == 99:
+            return [], False
+        if instr.op_code not in JUMPS:
+            return [next_address], False
+        (condition_mode, condition), (target_mode, target) = instr.params
+        if condition_mode == 1:
+            # A constant condition always or never jumps
+            taken = (condition != 0) == (instr.op_code == 5)
+            if not taken:
+                return [next_address], False
+            return ([target], False) if target_mode == 1 else ([], True)
+        return ([target, next_address], False) if target_mode == 1 else ([next_address], True)
+
+    def __disassemble(self):
+        pending = [0]
+        while pending:
+            address = pending.pop()
+            if address in self.instructions or address in self.invalid or address < 0:
+                continue
+            instr = self.decode(address)
+            if instr is None:
+                self.invalid.add(address)
+                continue
+            self.instructions[address] = instr
+            pending.extend(self.successors(instr)[0])
+
+    def __build_blocks(self):
+        leaders = {0}
+        for instr in self.instructions.values():
+            targets, _ = self.successors(instr)
+            if instr.op_code in JUMPS or instr.op_code == 99:
+                leaders.update(targets)
+                leaders.add(instr.address + len(instr.params) + 1)
+        leaders = sorted(a for a in leaders if a in self.instructions or a in self.invalid)
+        for start in leaders:
+            block = self.blocks[start] = Block(start)
+            address = start
+            while address in self.instructions:
+                instr = self.instructions[address]
+                block.instructions.append(instr)
+                block.successors, block.indirect = self.successors(instr)
+                address = block.end
+                if instr.op_code in JUMPS or instr.op_code == 99 or address in self.blocks or address in leaders:
+                    break
+            if address in self.invalid and not block.successors:
+                block.invalid = True
+            elif address in self.invalid:
+                block.invalid = address in block.successors
+
+    def __find_loops(self):
+        # Depth first search, a loop header is the target of an edge back to a block still on the stack
+        state = {}
+        stack = [(0, iter(self.blocks[0].successors))] if 0 in self.blocks else []
+        state[0] = 'open'
+        while stack:
+            start, successors = stack[-1]
+            for successor in successors:
+                if successor not in self.blocks:
+                    continue
+                if state.get(successor) == 'open':
+                    self.loop_headers.add(successor)
+                elif successor not in state:
+                    state[successor] = 'open'
+                    stack.append((successor, iter(self.blocks[successor].successors)))
+                    break
+            else:
+                state[start] = 'closed'
+                stack.pop()
+
+    def __find_writes(self):
+        code = self.code()
+        for instr in self.instructions.values():
+            write = WRITE_PARAMS.get(instr.op_code)
+            if write is None:
+                continue
+            mode, param = instr.params[write]
+            if mode == 2:
+                self.dynamic_writes.add(instr.address)
+            elif param in code:
+                self.self_modified.add(param)
+
+    def code(self) -> {int}:
+        """
+        Every address holding an instruction or its parameters
+        """
+        return {a for instr in self.instructions.values()
+                for a in range(instr.address, instr.address + len(instr.params) + 1)}
+
+    def classify(self, address: int) -> str:
+        """
+        Whether address is 'code', 'data' or 'self-modified' code
+        """
+        if address in self.self_modified:
+            return 'self-modified'
+        return 'code' if address in self.code() else 'data'
+
+    def is_static(self) -> bool:
+        """
+        Whether the program provably never writes over its own code, so its decoded and compiled instructions
+        never go stale. Writes through the relative base aren't tracked, so any of them makes this False.
+        """
+        return not self.self_modified and not self.dynamic_writes
+
+    def __str__(self):
+        lines = []
+        for start, block in sorted(self.blocks.items()):
+            notes = ['loop header'] if start in self.loop_headers else []
+            notes += ['indirect jump'] if block.indirect else []
+            notes += ['invalid op code at %d' % block.end] if block.invalid else []
+            successors = ', '.join(map(str, block.successors)) or '-'
+            lines.append('block %d -> %s%s' % (start, successors, ' (%s)' % ', '.join(notes) if notes else ''))
+            for instr in block.instructions:
+                lines.append('  ' + format_instruction(instr, self.self_modified))
+        return '\n'.join(lines)
+
+
+def format_param(mode: int, param: int) -> str:
+    if mode == 1:
+        return str(param)
+    if mode == 0:
+        return '[%d]' % param
+    return '[rb%+d]' % param
+
+
+def format_instruction(instr: Instruction, self_modified: {int} = frozenset()) -> str:
+    params = ', '.join(format_param(*p) for p in instr.params)
+    modified = any(a in self_modified for a in range(instr.address, instr.address + len(instr.params) + 1))
+    return '%6d  %-20s %s%s' % (instr.address, OP_NAMES[instr.op_code], params, '  ; self-modified' if modified else '')
+
+
+def disassemble(tape: [int]) -> ControlFlowGraph:
+    return ControlFlowGraph(list(tape))
+
+
+def count_steps(tape: [int], parameters: [int] = (), max_steps: int = 10 ** 7) -> int:
+    """
+    How many instructions running tape as a function of parameters takes.
+    Returns None if it doesn't halt within max_steps, or runs out of input.
+    """
+    m = IntCode(tape, parameter_input(*parameters), Channel().store)
+    m.status = STATUS_CODES.RUNNING
+    steps = m.step(max_steps)
+    # Counting the halt, as the profiler does
+    return steps + 1 if m.status == STATUS_CODES.FINISHED else None
+
+
+def main(argv: [str] = None) -> int:
+    from util.tapefile import load_tape
+
+    parser = argparse.ArgumentParser(description='Disassembles an IntCode tape')
+    parser.add_argument('tape', help='A text or binary tape file')
+    parser.add_argument('--steps', type=int, nargs='*', help='Also count the steps it takes given these inputs')
+    parser.add_argument('--max-steps', type=int, default=10 ** 7, help='Give up counting steps after this many')
+    args = parser.parse_args(argv)
+
+    tape = list(load_tape(args.tape))
+    graph = disassemble(tape)
+    print(graph)
+    print()
+    print('%d instructions in %d blocks, %d loops'
+          % (len(graph.instructions), len(graph.blocks), len(graph.loop_headers)))
+    print('self-modified addresses: %s' % (sorted(graph.self_modified) or 'none'))
+    print('writes through the relative base at: %s' % (sorted(graph.dynamic_writes) or 'none'))
+    if args.steps is not None:
+        steps = count_steps(tape, args.steps, args.max_steps)
+        print('steps: %s' % ('more than %d' % args.max_steps if steps is None else steps))
+    return 0
+
+
+def test_disassemble():
+    # Outputs 1 to 5
+    tape = [1001, 14, 1, 14, 4, 14, 1007, 14, 5, 15, 1005, 15, 0, 99, 0, 0]
+    graph = disassemble(tape)
+    assert [0, 13] == sorted(graph.blocks)
+    assert [0, 13] == sorted(graph.blocks[0].successors)
+    assert {0} == graph.loop_headers
+    assert 'code' == graph.classify(12) and 'data' == graph.classify(14)
+    assert graph.is_static()
+    assert '       0  add                  [14], 1, [14]' == str(graph).splitlines()[1]
+    assert 21 == count_steps(tape)
+    assert count_steps([1105, 1, 0], max_steps=100) is None
+
+
+def test_self_modifying():
+    # Writes 99 over the output instruction at 4, so it halts
+    tape = [1101, 0, 99, 4, 4, 0]
+    graph = disassemble(tape)
+    assert {4} == graph.self_modified
+    assert 'self-modified' == graph.classify(4)
+    assert not graph.is_static()
+    # An indirect jump, and a relative write
+    graph = disassemble([3, 9, 21101, 1, 2, 0, 5, 9, 9, 99])
+    assert graph.blocks[0].indirect
+    assert {2} == graph.dynamic_writes
+
+
+if __name__ == '__main__':
+    sys.exit(main())
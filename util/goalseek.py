@@ -0,0 +1,182 @@
+from fractions import Fraction
+from itertools import product
+from typing import Union, Tuple
+
+from util.batch import BatchIntCode
+from util.intcode import IntCode, Channel, parameter_input
+
+
+class GoalSeek:
+    """
+    Searches for values to patch into a tape's addresses so that the program produces a target.
+    The program's result is the value left at output_address once it halts, or its first output if that's None.
+    A combination that outputs nothing has no result, and the linear and monotonic strategies give up on meeting one.
+    Cheaper strategies are tried first, and any answer they find is checked by running the program:
+    - If the result looks linear in every parameter, solves for one of them directly
+    - If the result looks monotonic in the last parameter, bisects it for each combination of the others
+    - Otherwise runs every combination through a BatchIntCode
+    """
+
+    # How many points of the last domain to sample when checking it's monotonic
+    MONOTONIC_SAMPLES = 8
+    # How many combinations to run in each batch of an exhaustive search
+    BATCH_SIZE = 4096
+
+    def __init__(self, tape: [int], addresses: [int], domains: [range], output_address: int = None):
+        self.tape = list(tape)
+        self.addresses = list(addresses)
+        self.domains = [list(d) for d in domains]
+        self.output_address = output_address
+        # Results of every combination run so far
+        self.results = {}
+        self.runs = 0
+
+    def evaluate(self, values: Tuple[int, ...]) -> Union[int, None]:
+        if values in self.results:
+            return self.results[values]
+        tape = list(self.tape)
+        for address, value in zip(self.addresses, values):
+            tape[address] = value
+        channel = Channel()
+        m = IntCode(tape, parameter_input(), channel.store)
+        m.run()
+        self.runs += 1
+        if self.output_address is not None:
+            r = m.tape[self.output_address]
+        else:
+            outputs = channel.drain()
+            r = outputs[0] if outputs else None
+        self.results[values] = r
+        return r
+
+    def seek(self, target: int) -> Union[Tuple[int, ...], None]:
+        for strategy in (self.solve_linear, self.bisect):
+            values = strategy(target)
+            if values is not None:
+                return values
+        return self.exhaustive(target)
+
+    def solve_linear(self, target: int) -> Union[Tuple[int, ...], None]:
+        base = tuple(d[0] for d in self.domains)
+        last = tuple(d[-1] for d in self.domains)
+        c = self.evaluate(base)
+        if c is None:
+            return None
+        slopes = []
+        for i, d in enumerate(self.domains):
+            if len(d) < 2:
+                slopes.append(Fraction(0))
+                continue
+            second = self.evaluate(base[:i] + (d[1],) + base[i + 1:])
+            end = self.evaluate(base[:i] + (d[-1],) + base[i + 1:])
+            if second is None or end is None:
+                return None
+            slope = Fraction(second - c, d[1] - d[0])
+            if end - c != slope * (d[-1] - d[0]):
+                return None
+            slopes.append(slope)
+        r = self.evaluate(last)
+        if r is None or r - c != sum(s * (x - x0) for s, x, x0 in zip(slopes, last, base)):
+            return None
+
+        # Solve for the parameter with the largest domain, given every combination of the others
+        free = [i for i, s in enumerate(slopes) if s != 0]
+        if not free:
+            return base if c == target else None
+        j = max(free, key=lambda i: len(self.domains[i]))
+        domain_j = set(self.domains[j])
+        for others in product(*(d if i != j else [None] for i, d in enumerate(self.domains))):
+            rest = c + sum(s * (x - x0) for i, (s, x, x0) in enumerate(zip(slopes, others, base)) if i != j)
+            x_j = base[j] + (target - rest) / slopes[j]
+            if x_j.denominator != 1 or int(x_j) not in domain_j:
+                continue
+            values = others[:j] + (int(x_j),) + others[j + 1:]
+            if self.evaluate(values) == target:
+                return values
+        return None
+
+    def bisect(self, target: int) -> Union[Tuple[int, ...], None]:
+        domain = self.domains[-1]
+        base = tuple(d[0] for d in self.domains[:-1])
+        step = max(1, len(domain) // self.MONOTONIC_SAMPLES)
+        samples = [self.evaluate(base + (x,)) for x in domain[::step] + domain[-1:]]
+        if None in samples:
+            return None
+        if all(a <= b for a, b in zip(samples, samples[1:])):
+            increasing = True
+        elif all(a >= b for a, b in zip(samples, samples[1:])):
+            increasing = False
+        else:
+            return None
+
+        for others in product(*self.domains[:-1]):
+            lo, hi = 0, len(domain) - 1
+            while lo < hi:
+                mid = (lo + hi) // 2
+                r = self.evaluate(others + (domain[mid],))
+                if r is None:
+                    return None
+                if (r < target) == increasing and r != target:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            values = others + (domain[lo],)
+            if self.evaluate(values) == target:
+                return values
+        return None
+
+    def exhaustive(self, target: int) -> Union[Tuple[int, ...], None]:
+        combinations = product(*self.domains)
+        while True:
+            chunk = [c for _, c in zip(range(self.BATCH_SIZE), combinations)]
+            if not chunk:
+                return None
+            batch = BatchIntCode(self.tape, [[]] * len(chunk))
+            for i, address in enumerate(self.addresses):
+                batch.patch(address, [c[i] for c in chunk])
+            batch.run()
+            self.runs += len(chunk)
+            if self.output_address is not None:
+                results = batch.cell(self.output_address)
+            else:
+                results = [outputs[0] if outputs else None for outputs in batch.outputs]
+            for values, r in zip(chunk, results):
+                if r == target:
+                    return values
+
+
+def goal_seek(tape: [int], addresses: [int], domains: [range], target: int,
+              output_address: int = None) -> Union[Tuple[int, ...], None]:
+    return GoalSeek(tape, addresses, domains, output_address).seek(target)
+
+
+def test_linear():
+    # tape[0] = tape[13] * 100 + tape[14]
+    tape = [1002, 13, 100, 0, 1, 0, 14, 0, 99, 0, 0, 0, 0, 0, 0]
+    s = GoalSeek(tape, [13, 14], [range(100), range(100)], 0)
+    assert (42, 7) == s.seek(4207)
+    assert s.runs < 10
+    assert goal_seek(tape, [13, 14], [range(100), range(100)], 10 ** 6, 0) is None
+
+
+def test_bisect():
+    # Outputs tape[15] * tape[15] + tape[16]
+    tape = [2, 15, 15, 17, 1, 17, 16, 17, 4, 17, 99, 0, 0, 0, 0, 0, 0, 0]
+    s = GoalSeek(tape, [15, 16], [range(20), range(20)])
+    assert (12, 5) == s.seek(149)
+    assert s.runs < 200
+
+
+def test_exhaustive():
+    tape = [1, 9, 10, 3, 2, 3, 11, 0, 99, 30, 40, 50]
+    s = GoalSeek(tape, [1, 2], [range(12), range(12)], 0)
+    assert (9, 10) == s.seek(3500)
+
+
+def test_no_output():
+    # Outputs 1, unless tape[11] is 0 when it halts without any output
+    tape = [1006, 11, 7, 104, 1, 99, 0, 99, 0, 0, 0, 0]
+    s = GoalSeek(tape, [11], [range(5)])
+    assert s.evaluate((0,)) is None
+    assert s.solve_linear(1) is None and s.bisect(1) is None
+    assert (1,) == s.seek(1)
@@ -0,0 +1,68 @@
+"""
+Loads puzzle inputs on first use, and keeps them for the rest of the process.
+Paths are relative to the calling module's file, pass __file__, so puzzles don't depend on the working directory.
+Inputs are returned as tuples, so a caller can't change what every later caller gets.
+Tapes to run are also available as a Tape sharing its pages copy-on-write, which IntCode shares rather than copies.
+"""
+import os
+from functools import lru_cache
+from typing import Tuple
+
+from util.intcode import Tape
+from util.tapefile import load_tape
+
+
+def input_path(module_file: str, name: str = 'input.txt') -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(module_file)), name)
+
+
+@lru_cache(maxsize=None)
+def load_lines(path: str) -> Tuple[str, ...]:
+    with open(path) as f:
+        return tuple(line.rstrip('\n') for line in f)
+
+
+@lru_cache(maxsize=None)
+def load_cached_tape(path: str) -> Tape:
+    # Either a text tape or one compiled by util.tapefile
+    return load_tape(path)
+
+
+@lru_cache(maxsize=None)
+def load_tape_tuple(path: str) -> Tuple[int, ...]:
+    return tuple(load_cached_tape(path))
+
+
+def shared_tape(path: str) -> Tape:
+    """
+    A copy of the cached tape at path, which only copies the pages either of them writes to
+    """
+    return load_cached_tape(path).copy()
+
+
+def read_lines(module_file: str, name: str = 'input.txt') -> Tuple[str, ...]:
+    return load_lines(input_path(module_file, name))
+
+
+def read_tape(module_file: str, name: str = 'input.txt') -> Tuple[int, ...]:
+    return load_tape_tuple(input_path(module_file, name))
+
+
+def read_shared_tape(module_file: str, name: str = 'input.txt') -> Tape:
+    return shared_tape(input_path(module_file, name))
+
+
+def test_read(tmp_path):
+    module_file = os.path.join(tmp_path, 'puzzle.py')
+    with open(os.path.join(tmp_path, 'input.txt'), 'w') as f:
+        f.write('104,1125899906842624,99\n')
+    tape = read_tape(module_file)
+    assert (104, 1125899906842624, 99) == tape
+    assert tape is read_tape(module_file)
+    assert ('104,1125899906842624,99',) == read_lines(module_file)
+    # Writing to a shared tape doesn't change the cached one
+    shared = read_shared_tape(module_file)
+    assert shared.pages[0] is read_shared_tape(module_file).pages[0]
+    shared[0] = 4
+    assert [4, 1125899906842624, 99] == list(shared)
+    assert [104, 1125899906842624, 99] == list(read_shared_tape(module_file))
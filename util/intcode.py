@@ -1,7 +1,13 @@
 import enum
+import hashlib
+import os
+import struct
+import sys
+import time
+from array import array
+from collections import namedtuple, deque, OrderedDict
 from collections.abc import MutableSequence
-from itertools import repeat
-from typing import Callable, Iterator, Union, Tuple
+from typing import Callable, Iterator, Iterable, Union, Tuple
 
 
 def __terminal_input__():
@@ -38,43 +44,179 @@ class Memory(Iterator):
         return self.memory.pop()
 
 
+class ChannelFull(Exception):
+    """
+    Raised when storing to a Channel that's at capacity.
+    Pauses the IntCode machine writing to it, which retries the write when it's next run.
+    """
+    pass
+
+
+class Channel(Iterator):
+    """
+    A first in, first out queue of values, which can stand in for Memory.
+    Use store as a machine's output, and the channel itself as another machine's input.
+    - A capacity bounds how many values it holds, past that store raises ChannelFull
+    """
+
+    def __init__(self, capacity: int = None):
+        self.values = deque()
+        self.capacity = capacity
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def store(self, value: int):
+        if self.capacity is not None and len(self.values) >= self.capacity:
+            raise ChannelFull()
+        self.values.append(value)
+
+    def extend(self, values: [int]):
+        """
+        Stores every value in values, regardless of capacity
+        """
+        self.values.extend(values)
+
+    def drain(self) -> [int]:
+        """
+        Removes and returns every value, oldest first
+        """
+        values = list(self.values)
+        self.values.clear()
+        return values
+
+    def __next__(self):
+        if not self.values:
+            raise StopIteration()
+        return self.values.popleft()
+
+
+Snapshot = namedtuple('Snapshot', 'position status pause_code tape')
+
 STATUS_CODES = enum.Enum('STATUS_CODES', 'INIT RUNNING PAUSED FINISHED')
-PAUSE_CODES = enum.Enum('PAUSE_CODES', 'READING')
+PAUSE_CODES = enum.Enum('PAUSE_CODES', 'READING WRITING YIELDED')
+
+# How many instructions a time sliced run executes between checks of its deadline
+SLICE_STEPS = 1000
+
+# A checkpoint file is CHECKPOINT_HEADER, then one record appended by every IntCode.save:
+# CHECKPOINT_STATE, then CHECKPOINT_PAGE and the cells of each page written to since the previous record.
+# Int64 pages are stored as little-endian int64s, list pages as comma separated text.
+CHECKPOINT_MAGIC = b'ICCK'
+CHECKPOINT_VERSION = 1
+CHECKPOINT_HEADER = struct.Struct('<4sH')
+CHECKPOINT_STATE = struct.Struct('<qqBBQI')
+CHECKPOINT_PAGE = struct.Struct('<QBI')
+
+
+PAGE_BITS = 10
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+EMPTY_PAGE = array('q', [0]) * PAGE_SIZE
 
 
 class Tape(MutableSequence):
+    """
+    A sparse address space split into pages of PAGE_SIZE cells.
+    - Pages are only allocated once an address within them is written to
+    - Pages are int64 arrays, and fall back to a list once a value no longer fits, or isn't an int at all
+    """
 
     def __init__(self, data=()):
         self.relative_base = 0
-        self.list = []
+        # Pages keyed by page number
+        self.pages = {}
+        # One past the highest address written to
+        self.length = 0
+        # Decoded instructions keyed by address, see IntCode.decode
+        self.instructions = {}
+        # Compiled blocks keyed by their first address, see IntCode.compile
+        self.blocks = {}
+        # The starting addresses of every compiled block covering an address
+        self.code = {}
+        # Addresses of compiled code that have since been written to, these are always interpreted
+        self.modified = set()
+        # Page numbers shared with another tape, copied before they're first written to
+        self.shared = set()
+        # The checkpoint file last saved to, the pages it holds and where its last complete record ends,
+        # see IntCode.save
+        self.checkpoint = None
+        # The tape's fingerprint, see fingerprint, until it's next written to
+        self.digest = None
         self.extend(data)
 
     def __len__(self) -> int:
-        return len(self.list)
+        return self.length
+
+    def __iter__(self):
+        # A page at a time, rather than looking up every cell
+        for n in range((self.length + PAGE_MASK) >> PAGE_BITS):
+            page = self.pages.get(n, EMPTY_PAGE)
+            yield from page[:self.length - (n << PAGE_BITS)] if self.length - (n << PAGE_BITS) < PAGE_SIZE else page
+
+    def extend(self, values) -> None:
+        i = self.length
+        for v in values:
+            self[i] = v
+            i += 1
 
     def insert(self, index: int, v) -> None:
         if index < 0:
             raise IndexError('Tape doesn\'t support negative indices')
-        ext = len(self.list) - index
-        if ext > 0:
-            self.list.extend(repeat(0, ext))
-        self.list.insert(index, v)
+        # Shift everything from index upwards along by one
+        for j in reversed(range(index, self.length)):
+            self[j + 1] = self[j]
+        self[index] = v
+
+    def page(self, i: int):
+        """
+        Returns the page containing address i, allocating it if it hasn't been written to yet.
+        """
+        n = i >> PAGE_BITS
+        page = self.pages.get(n)
+        if page is None:
+            page = self.pages[n] = array('q', EMPTY_PAGE)
+        elif n in self.shared:
+            # Shared pages may be read-only views of a tape file, see util.tapefile
+            page = self.pages[n] = list(page) if isinstance(page, list) else array('q', page)
+            self.shared.remove(n)
+        return page
+
+    def copy(self) -> 'Tape':
+        """
+        Copies the tape, sharing its pages until either tape writes to them.
+        """
+        t = Tape()
+        t.relative_base = self.relative_base
+        t.length = self.length
+        t.digest = self.digest
+        t.pages.update(self.pages)
+        self.shared.update(self.pages)
+        t.shared.update(self.pages)
+        return t
 
     def __getitem__(self, i: Union[int, slice, Tuple[int, int]]):
         if isinstance(i, tuple):
             mode, param = i
-            return {
-                0: lambda: self[param],
-                1: lambda: param,
-                2: lambda: self[self.relative_base + param]
-            }[mode]()
-        if isinstance(i, slice):
-            return [self[j] for j in range(i.start, i.stop, 1 if i.step is None else i.step)]
+            if mode == 1:
+                return param
+            i = param if mode == 0 else self.relative_base + param
+        elif isinstance(i, slice):
+            step = 1 if i.step is None else i.step
+            if step == 1 and 0 <= i.start and (i.start ^ (i.stop - 1)) >> PAGE_BITS == 0:
+                # The whole slice sits within one page
+                page = self.pages.get(i.start >> PAGE_BITS)
+                offset = i.start & PAGE_MASK
+                if page is None:
+                    return [0] * (i.stop - i.start)
+                return page[offset:offset + i.stop - i.start]
+            return [self[j] for j in range(i.start, i.stop, step)]
         if i < 0:
             raise IndexError('Tape doesn\'t support negative indices')
-        if len(self.list) <= i:
+        try:
+            return self.pages[i >> PAGE_BITS][i & PAGE_MASK]
+        except KeyError:
             return 0
-        return self.list[i]
 
     def __setitem__(self, i: Union[int, slice, tuple], vs) -> None:
         if isinstance(i, tuple):
@@ -90,13 +232,37 @@ class Tape(MutableSequence):
             return
         if i < 0:
             raise IndexError('Tape doesn\'t support negative indices')
-        ext = i - len(self.list) + 1
-        if ext > 0:
-            self.list.extend(repeat(0, ext))
-        self.list[i] = vs
+        page = self.page(i)
+        try:
+            page[i & PAGE_MASK] = vs
+        except (OverflowError, TypeError):
+            page = self.pages[i >> PAGE_BITS] = list(page)
+            page[i & PAGE_MASK] = vs
+        if i >= self.length:
+            self.length = i + 1
+        self.digest = None
+        # Self-modifying programs may overwrite an instruction that has already been decoded
+        self.instructions.pop(i, None)
+        if i in self.code:
+            self.invalidate(i)
+
+    def invalidate(self, i: int) -> None:
+        """
+        Drops every compiled block covering address i, and stops it from being compiled again.
+        """
+        for start in self.code.pop(i):
+            self.blocks.pop(start, None)
+        self.modified.add(i)
 
     def __delitem__(self, i: int) -> None:
-        del self.list[i]
+        if i < 0:
+            raise IndexError('Tape doesn\'t support negative indices')
+        # Shift everything above i down by one
+        for j in range(i, self.length - 1):
+            self[j] = self[j + 1]
+        if i < self.length:
+            self[self.length - 1] = 0
+            self.length -= 1
 
 
 class IntCode:
@@ -105,8 +271,23 @@ class IntCode:
     - Reads to unwritten memory returns 0
     """
 
-    def __init__(self, tape: [int], stdin: Iterator[int] = TERMINAL_INPUT,
-                 stdout: Callable[[int], None] = TERMINAL_OUTPUT):
+    # Op codes that can be compiled into a block, and whether they end it
+    COMPILABLE = {1: False, 2: False, 5: True, 6: True, 7: False, 8: False, 9: False}
+
+    def __init__(self, tape: Union[Tape, Iterable[int]], stdin: Iterator[int] = TERMINAL_INPUT,
+                 stdout: Callable[[int], None] = TERMINAL_OUTPUT, jit: bool = False, profiler=None,
+                 frame: int = None):
+        """
+        :param tape: The program, a Tape is shared copy-on-write rather than copied
+        :param jit: Compile straight-line runs of instructions into python functions rather than interpreting them
+        :param profiler: A util.profiler.Profiler to record every instruction into, the machine is always interpreted
+        :param frame: Call stdout once per this many outputs with them as a tuple, rather than once per output.
+                      A partially output frame isn't part of a snapshot or checkpoint.
+        """
+        self.jit = jit
+        self.profiler = profiler
+        self.frame = frame
+        self.pending_frame = []
         self.relative_base = 0
         self.status = STATUS_CODES.INIT
         self.pause_code = None
@@ -117,14 +298,14 @@ class IntCode:
             1: (3, self.add_instruction),
             2: (3, self.mul_instruction),
             3: (1, self.input_instruction),
-            4: (1, self.output_instruction),
+            4: (1, self.output_instruction if frame is None else self.framed_output_instruction),
             5: (2, self.jump_if_true_instruction),
             6: (2, self.jump_if_false_instruction),
             7: (3, self.less_than_instruction),
             8: (3, self.equals_instruction),
             9: (1, self.adjust_relative_base_instruction)
         }
-        self.tape = Tape(tape)
+        self.tape = tape.copy() if isinstance(tape, Tape) else Tape(tape)
 
     def adjust_relative_base_instruction(self, params: [(int, int)]):
         adjustment = self.tape[params[0]]
@@ -149,7 +330,26 @@ class IntCode:
 
     def output_instruction(self, params: [(int, int)]):
         in_addr = self.tape[params[0]]
-        self.stdout(in_addr)
+        try:
+            self.stdout(in_addr)
+        except ChannelFull:
+            self.status = STATUS_CODES.PAUSED
+            self.pause_code = PAUSE_CODES.WRITING
+
+    def framed_output_instruction(self, params: [(int, int)]):
+        v = self.tape[params[0]]
+        pending = self.pending_frame
+        if len(pending) + 1 < self.frame:
+            pending.append(v)
+            return
+        try:
+            self.stdout((*pending, v))
+        except ChannelFull:
+            # The frame is only complete once it's been written, so it's output whole when retried
+            self.status = STATUS_CODES.PAUSED
+            self.pause_code = PAUSE_CODES.WRITING
+            return
+        pending.clear()
 
     def jump_if_true_instruction(self, params: [(int, int)]):
         condition, new_position = [self.tape[i] for i in params]
@@ -171,36 +371,467 @@ class IntCode:
         out = int(in_1 == in_2)
         self.tape[params[2]] = out
 
-    def run(self):
-        self.status = STATUS_CODES.RUNNING
+    def decode(self, position: int) -> (int, int, Callable, Tuple[int, ...]):
+        """
+        Decodes the instruction at position into (op_code, param_count, op, param_modes).
+        The result is cached on the tape until that address is written to.
+        Raises KeyError for an unknown op code, and ValueError for a negative instruction, a mode other than 0, 1 or 2,
+        or more modes than the op code has parameters. Any instruction ending in 99 halts, whatever comes before it.
+        """
+        instr = self.tape[position]
+        op_code = abs(instr) % 100
+        if op_code == 99:
+            decoded = (op_code, 0, None, ())
+        else:
+            if instr < 0:
+                raise ValueError('Negative instruction %d at %d' % (instr, position))
+            (param_count, op) = self.OPCODES[op_code]
+            # Any modes not declared are considered '0'
+            param_modes = tuple(instr // 10 ** (i + 2) % 10 for i in range(param_count))
+            if any(m > 2 for m in param_modes) or instr // 10 ** (param_count + 2) != 0:
+                raise ValueError('Invalid modes in instruction %d at %d' % (instr, position))
+            decoded = (op_code, param_count, op, param_modes)
+        self.tape.instructions[position] = decoded
+        return decoded
+
+    def compile(self, position: int) -> Union[Callable[[Tape], int], None]:
+        """
+        Compiles the block of instructions starting at position into a function.
+        The function takes the tape, executes the block and returns the position to continue from.
+        A block ends at a jump, or before any instruction that can't be compiled.
+        Returns None if the instruction at position has to be interpreted.
+        """
+        tape = self.tape
+        instrs = []
+        end = position
+        # Static writes ahead of the block mustn't be compiled over
+        limit = None
+        while True:
+            if tape[end] < 0 or tape[end] % 100 not in self.COMPILABLE:
+                break
+            try:
+                (op_code, param_count, _, param_modes) = self.decode(end)
+            except ValueError:
+                # Left for the interpreter to raise, should execution ever get there
+                break
+            next_position = end + param_count + 1
+            if limit is not None and next_position > limit:
+                break
+            if any(a in tape.modified for a in range(end, next_position)):
+                break
+            instrs.append((op_code, param_modes, list(tape[end + 1:next_position]), next_position))
+            end = next_position
+            if self.COMPILABLE[op_code]:
+                break
+            if param_count == 3 and param_modes[2] == 0:
+                target = instrs[-1][2][2]
+                if position <= target < end:
+                    break
+                if target >= end and (limit is None or target < limit):
+                    limit = target
+        if not instrs:
+            return None
+
+        def read(mode, param):
+            if mode == 1:
+                return repr(param)
+            if mode == 0 and param >= 0:
+                return f'get({param >> PAGE_BITS}, EMPTY_PAGE)[{param & PAGE_MASK}]'
+            if mode == 0:
+                return f't[{param}]'
+            return f't[t.relative_base + {param}]'
+
+        lines = [f'def block(t):']
+        # Whether the block can leave before its end, having run fewer than all of its instructions
+        guarded = False
+        for (op_code, param_modes, params, next_position) in instrs:
+            args = [read(m, p) for m, p in zip(param_modes, params)]
+            if op_code == 9:
+                lines.append(f'    t.relative_base += {args[0]}')
+                continue
+            if op_code == 5:
+                lines.append(f'    if {args[0]} != 0: return {args[1]}')
+                continue
+            if op_code == 6:
+                lines.append(f'    if {args[0]} == 0: return {args[1]}')
+                continue
+            value = {
+                1: '{} + {}',
+                2: '{} * {}',
+                7: '1 if {} < {} else 0',
+                8: '1 if {} == {} else 0'
+            }[op_code].format(*args[:2])
+            mode, param = param_modes[2], params[2]
+            if mode == 1:
+                raise ValueError('Can only write to an address')
+            if mode == 0:
+                lines.append(f'    t[{param}] = {value}')
+            else:
+                # Relative writes are only known at runtime, leave the block if it wrote over itself
+                lines.append(f'    a = t.relative_base + {param}')
+                lines.append(f'    t[a] = {value}')
+                if next_position < end:
+                    lines.append(f'    if {position} <= a < {end}: return {next_position}')
+                    guarded = True
+        lines.append(f'    return {end}')
+
+        namespace = {'get': tape.pages.get, 'EMPTY_PAGE': EMPTY_PAGE}
+        exec(compile('\n'.join(lines), f'<intcode block {position}>', 'exec'), namespace)
+        block = tape.blocks[position] = namespace['block']
+        block.steps = len(instrs)
+        block.guarded = guarded
+        for a in range(position, end):
+            tape.code.setdefault(a, []).append(position)
+        return block
+
+    def snapshot(self) -> Snapshot:
+        """
+        Captures the machine's state. The tape is shared copy-on-write with the running machine.
+        """
+        return Snapshot(self.position, self.status, self.pause_code, self.tape.copy())
+
+    def restore(self, snapshot: Snapshot):
+        """
+        Puts the machine back into the state captured by snapshot. The snapshot can be restored again later.
+        """
+        self.position = snapshot.position
+        self.status = snapshot.status
+        self.pause_code = snapshot.pause_code
+        self.tape = snapshot.tape.copy()
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Snapshot, stdin: Iterator[int] = TERMINAL_INPUT,
+                      stdout: Callable[[int], None] = TERMINAL_OUTPUT, jit: bool = False, profiler=None,
+                      frame: int = None) -> 'IntCode':
+        m = cls((), stdin, stdout, jit, profiler, frame)
+        m.restore(snapshot)
+        return m
+
+    def fork(self, stdin: Iterator[int] = TERMINAL_INPUT,
+             stdout: Callable[[int], None] = TERMINAL_OUTPUT) -> 'IntCode':
+        """
+        Creates a copy of this machine reading from stdin and writing to stdout, with its profiler and frame.
+        Neither machine sees the other's writes to the tape. A partially output frame is copied too.
+        """
+        m = IntCode.from_snapshot(self.snapshot(), stdin, stdout, self.jit, self.profiler, self.frame)
+        m.pending_frame = list(self.pending_frame)
+        return m
+
+    def save(self, path: str):
+        """
+        Checkpoints the machine's state and tape to path, see CHECKPOINT_HEADER.
+        Saving to the same path again only appends the pages written to since, after the last complete record,
+        so an incomplete one left by a save that didn't finish is written over. Saved pages are marked shared,
+        so any write after a save copies the page and it's no longer the one in the checkpoint.
+        """
+        tape = self.tape
+        if (tape.checkpoint is not None and tape.checkpoint[0] == path and os.path.exists(path)
+                and os.path.getsize(path) >= tape.checkpoint[2]):
+            _, saved, offset = tape.checkpoint
+            mode = 'r+b'
+        else:
+            saved = {}
+            mode = 'wb'
+        dirty = [n for n, page in sorted(tape.pages.items()) if saved.get(n) is not page]
+
+        record = bytearray(CHECKPOINT_STATE.pack(
+            self.position, tape.relative_base, self.status.value,
+            0 if self.pause_code is None else self.pause_code.value, tape.length, len(dirty)))
+        for n in dirty:
+            page = tape.pages[n]
+            if isinstance(page, list):
+                kind, data = 1, ','.join(map(str, page)).encode()
+            else:
+                cells = array('q', page)
+                if sys.byteorder != 'little':
+                    cells.byteswap()
+                kind, data = 0, cells.tobytes()
+            record += CHECKPOINT_PAGE.pack(n, kind, len(data))
+            record += data
+        with open(path, mode) as f:
+            if mode == 'wb':
+                f.write(CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION))
+            else:
+                f.truncate(offset)
+                f.seek(offset)
+            # One write per record, so a crash part way through only loses the latest record
+            f.write(record)
+            f.flush()
+            os.fsync(f.fileno())
+            offset = f.tell()
+
+        tape.checkpoint = (path, dict(tape.pages), offset)
+        tape.shared.update(tape.pages)
+
+    @classmethod
+    def load(cls, path: str, stdin: Iterator[int] = TERMINAL_INPUT,
+             stdout: Callable[[int], None] = TERMINAL_OUTPUT, jit: bool = False) -> 'IntCode':
+        """
+        Restores the machine saved to path, from the last complete record in the file.
+        The file is only read, an incomplete record left by a save that didn't finish is written over
+        by the next save of the machine back to path.
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version = CHECKPOINT_HEADER.unpack_from(data)
+        if magic != CHECKPOINT_MAGIC:
+            raise ValueError('%s is not a checkpoint' % path)
+        if version != CHECKPOINT_VERSION:
+            raise ValueError('%s is version %d of the checkpoint format, expected %d'
+                             % (path, version, CHECKPOINT_VERSION))
+
+        state = None
+        pages = {}
+        offset = CHECKPOINT_HEADER.size
+        while offset < len(data):
+            try:
+                record_state = CHECKPOINT_STATE.unpack_from(data, offset)
+                record_offset = offset + CHECKPOINT_STATE.size
+                record_pages = {}
+                for _ in range(record_state[-1]):
+                    n, kind, size = CHECKPOINT_PAGE.unpack_from(data, record_offset)
+                    record_offset += CHECKPOINT_PAGE.size
+                    if record_offset + size > len(data):
+                        raise struct.error('Truncated page')
+                    if kind not in (0, 1) or (kind == 0 and size != PAGE_SIZE * 8):
+                        raise struct.error('Malformed page')
+                    cells = data[record_offset:record_offset + size]
+                    record_offset += size
+                    if kind == 1:
+                        page = record_pages[n] = list(map(int, cells.decode().split(',')))
+                        if len(page) != PAGE_SIZE:
+                            raise struct.error('Malformed page')
+                    else:
+                        page = record_pages[n] = array('q', cells)
+                        if sys.byteorder != 'little':
+                            page.byteswap()
+            except (struct.error, ValueError):
+                # An incomplete record from a save that didn't finish
+                break
+            state = record_state
+            pages.update(record_pages)
+            offset = record_offset
+        if state is None:
+            raise ValueError('%s holds no complete checkpoint' % path)
+
+        position, relative_base, status, pause_code, length, _ = state
+        m = cls((), stdin, stdout, jit)
+        m.position = position
+        m.status = STATUS_CODES(status)
+        m.pause_code = None if pause_code == 0 else PAUSE_CODES(pause_code)
+        tape = m.tape
+        tape.relative_base = relative_base
+        tape.length = length
+        tape.pages.update(pages)
+        tape.checkpoint = (path, dict(pages), offset)
+        tape.shared.update(pages)
+        return m
+
+    def run_compiled(self):
+        tape = self.tape
+        blocks = tape.blocks
+        instructions = tape.instructions
         while True:
-            instr = str(self.tape[self.position])
-            op_code = int(instr[-2:])
+            block = blocks.get(self.position)
+            if block is None and self.position not in tape.modified:
+                block = self.compile(self.position)
+            if block is not None:
+                self.position = block(tape)
+                continue
+
+            decoded = instructions.get(self.position)
+            if decoded is None:
+                decoded = self.decode(self.position)
+            (op_code, param_count, op, param_modes) = decoded
             if op_code == 99:
                 self.status = STATUS_CODES.FINISHED
                 return
-            (param_count, op) = self.OPCODES[op_code]
 
-            raw_params = self.tape[self.position + 1:self.position + param_count + 1]
-            # Any modes not declared are considered '0'
-            param_modes = reversed(instr[:-2].zfill(len(raw_params)))
-            param_modes = list(map(int, param_modes))
+            raw_params = tape[self.position + 1:self.position + param_count + 1]
+            params = list(zip(param_modes, raw_params))
+            self.position += param_count + 1
+            op(params)
+            if self.status == STATUS_CODES.PAUSED:
+                self.position -= param_count + 1
+                return
+
+    def run_profiled(self, steps: int = None) -> int:
+        """
+        Runs at most steps instructions if given, returning how many were run
+        """
+        profiler = self.profiler
+        profiler.resume()
+        tape = self.tape
+        count = 0
+        try:
+            while steps is None or count < steps:
+                position = self.position
+                relative_base = tape.relative_base
+                (op_code, param_count, op, param_modes) = self.decode(position)
+                raw_params = tape[position + 1:position + param_count + 1]
+                params = list(zip(param_modes, raw_params))
+                if op_code == 99:
+                    profiler.record(position, op_code, params, relative_base)
+                    self.status = STATUS_CODES.FINISHED
+                    return count
+                self.position += param_count + 1
+                op(params)
+                if self.status == STATUS_CODES.PAUSED:
+                    self.position -= param_count + 1
+                    return count
+                profiler.record(position, op_code, params, relative_base)
+                count += 1
+            return count
+        finally:
+            profiler.pause(self.status == STATUS_CODES.PAUSED and self.pause_code == PAUSE_CODES.READING)
+
+    def step(self, steps: int) -> int:
+        """
+        Runs at most steps instructions, stopping early if the machine halts or pauses.
+        Returns how many instructions were run.
+        """
+        if self.profiler is not None:
+            return self.run_profiled(steps)
+        tape = self.tape
+        instructions = tape.instructions
+        blocks = tape.blocks if self.jit else None
+        count = 0
+        while count < steps:
+            if blocks is not None:
+                block = blocks.get(self.position)
+                if block is None and self.position not in tape.modified:
+                    block = self.compile(self.position)
+                # Blocks are charged for all their instructions, so one that doesn't fit in the steps left,
+                # or that might leave early and run fewer, is interpreted instead
+                if block is not None and not block.guarded and count + block.steps <= steps:
+                    self.position = block(tape)
+                    count += block.steps
+                    continue
+
+            decoded = instructions.get(self.position)
+            if decoded is None:
+                decoded = self.decode(self.position)
+            (op_code, param_count, op, param_modes) = decoded
+            if op_code == 99:
+                self.status = STATUS_CODES.FINISHED
+                return count
+
+            raw_params = tape[self.position + 1:self.position + param_count + 1]
+            params = list(zip(param_modes, raw_params))
+            self.position += param_count + 1
+            op(params)
+            if self.status == STATUS_CODES.PAUSED:
+                self.position -= param_count + 1
+                return count
+            count += 1
+        return count
 
-            assert len(raw_params) == len(param_modes)
+    def run_sliced(self, max_steps: int = None, deadline: float = None):
+        steps = 0
+        while self.status == STATUS_CODES.RUNNING:
+            out_of_steps = max_steps is not None and steps >= max_steps
+            if out_of_steps or (deadline is not None and time.monotonic() >= deadline):
+                self.status = STATUS_CODES.PAUSED
+                self.pause_code = PAUSE_CODES.YIELDED
+                return
+            n = SLICE_STEPS if deadline is not None else max_steps
+            if max_steps is not None:
+                n = min(n, max_steps - steps)
+            steps += self.step(n)
 
+    def run(self, max_steps: int = None, deadline: float = None):
+        """
+        Runs until the machine halts, or pauses to read or write. Either limit pauses it with PAUSE_CODES.YIELDED,
+        and running it again carries on from there.
+        :param max_steps: How many instructions to run before yielding
+        :param deadline: The time.monotonic() to yield at, checked every SLICE_STEPS instructions
+        """
+        self.status = STATUS_CODES.RUNNING
+        if max_steps is not None or deadline is not None:
+            return self.run_sliced(max_steps, deadline)
+        if self.profiler is not None:
+            return self.run_profiled()
+        if self.jit:
+            return self.run_compiled()
+        tape = self.tape
+        instructions = tape.instructions
+        while True:
+            decoded = instructions.get(self.position)
+            if decoded is None:
+                decoded = self.decode(self.position)
+            (op_code, param_count, op, param_modes) = decoded
+            if op_code == 99:
+                self.status = STATUS_CODES.FINISHED
+                return
+
+            raw_params = tape[self.position + 1:self.position + param_count + 1]
             params = list(zip(param_modes, raw_params))
             self.position += param_count + 1
             op(params)
             if self.status == STATUS_CODES.PAUSED:
-                self.position -= len(params) + 1
+                self.position -= param_count + 1
                 return
 
 
-def run_as_function(tape: [int], parameters: [int]) -> [int]:
-    mem = Memory()
-    m = IntCode(tape, parameter_input(*parameters), mem.store)
+def run_as_function(tape: [int], parameters: [int], jit: bool = False) -> [int]:
+    channel = Channel()
+    m = IntCode(tape, parameter_input(*parameters), channel.store, jit)
     m.run()
-    return mem.memory
+    # Most recent output first
+    return list(reversed(channel.drain()))
+
+
+CacheInfo = namedtuple('CacheInfo', 'hits misses maxsize currsize')
+
+
+def fingerprint(tape: Iterable[int]) -> str:
+    """
+    Identifies a tape by its contents. A Tape keeps its fingerprint until it's written to, as do copies of it.
+    """
+    if isinstance(tape, Tape):
+        if tape.digest is None:
+            tape.digest = hashlib.blake2b(','.join(map(str, tape)).encode(), digest_size=16).hexdigest()
+        return tape.digest
+    return hashlib.blake2b(','.join(map(str, tape)).encode(), digest_size=16).hexdigest()
+
+
+class FunctionCache:
+    """
+    Memoizes run_as_function, keyed by the tape's fingerprint and the parameters.
+    - Only runs that halt are cached, a program still waiting for input isn't a function of its parameters alone
+    - Past maxsize results, the least recently used is evicted
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, tape: [int], parameters: [int], jit: bool = False) -> [int]:
+        key = (fingerprint(tape), tuple(parameters))
+        result = self.results.get(key)
+        if result is not None:
+            self.hits += 1
+            self.results.move_to_end(key)
+            return list(result)
+        self.misses += 1
+        channel = Channel()
+        m = IntCode(tape, parameter_input(*parameters), channel.store, jit)
+        m.run()
+        result = list(reversed(channel.drain()))
+        if m.status == STATUS_CODES.FINISHED:
+            self.results[key] = tuple(result)
+            if len(self.results) > self.maxsize:
+                self.results.popitem(last=False)
+        return result
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self.results))
+
+    def clear(self):
+        self.results.clear()
+        self.hits = self.misses = 0
 
 
 def run(tape: [int], stdin: Iterator[int] = TERMINAL_INPUT):
@@ -264,11 +895,221 @@ def test_relative_base():
     assert 16 == len(str(r[0]))
 
 
+def test_malformed_instructions():
+    # A negative instruction, an unknown mode, and more modes than parameters
+    for tape in [[-1, 99], [304, 2, 99], [11104, 7, 99]]:
+        for jit in (False, True):
+            try:
+                run_as_function(tape, [], jit)
+                assert False
+            except ValueError:
+                pass
+    try:
+        run_as_function([42, 99], [])
+        assert False
+    except KeyError:
+        pass
+    # Only the last two digits of a halt are read
+    assert [] == run_as_function([199], [])
+
+
 def test_large_numbers():
     r = run_as_function([104, 1125899906842624, 99], [])
     assert 1125899906842624 == r[0]
 
 
+def test_self_modifying():
+    # The second pass must see the rewritten instruction at address 0, not the cached decode
+    r = run_as_function([4, 13, 1101, 0, 104, 0, 1001, 14, -1, 14, 1005, 14, 0, 99, 2], [])
+    assert [13, 99] == r
+    m = IntCode([1, 2, 3])
+    m.decode(0)
+    assert 0 in m.tape.instructions
+    m.tape[0] = 2
+    assert 0 not in m.tape.instructions
+
+
+def test_sparse_tape():
+    t = Tape([1, 2, 3])
+    t[10 ** 9] = 4
+    assert 2 == len(t.pages)
+    assert 10 ** 9 + 1 == len(t)
+    assert 0 == t[10 ** 8]
+    assert [1, 2, 3, 0] == list(t[0:4])
+    # Values that don't fit into an int64 move their page over to python ints
+    t[5] = 2 ** 70
+    assert isinstance(t.pages[0], list)
+    assert [2, 3, 0, 0, 2 ** 70] == list(t[1:6])
+    r = run_as_function([109, 10 ** 12, 21101, 3, 4, 0, 204, 0, 99], [])
+    assert [7] == r
+
+
+def test_jit():
+    for jit in (False, True):
+        r = run_as_function([109, 1, 204, -1, 1001, 100, 1, 100, 1008, 100, 16, 101, 1006, 101, 0, 99], [], jit)
+        assert [109, 1, 204, -1, 1001, 100, 1, 100, 1008, 100, 16, 101, 1006, 101, 0, 99] == list(reversed(r))
+        r = run_as_function([3, 12, 6, 12, 15, 1, 13, 14, 13, 4, 13, 99, -1, 0, 1, 9], [2], jit)
+        assert [1] == r
+        # Rewrites the add at address 0 into a multiply on the first pass through the loop
+        r = run_as_function([1101, 3, 4, 19, 4, 19, 1101, 0, 1102, 0, 1001, 18, -1, 18, 1005, 18, 0, 99, 2, 0],
+                            [], jit)
+        assert [12, 7] == r
+
+
+def test_fork():
+    # Echoes its inputs doubled until it reads a 0
+    tape = [3, 12, 1002, 12, 2, 13, 4, 13, 1005, 12, 0, 99, 0, 0]
+    mem = Memory()
+    m = IntCode(tape, parameter_input(), mem.store)
+    m.run()
+    assert STATUS_CODES.PAUSED == m.status
+    snapshot = m.snapshot()
+    forks = [IntCode.from_snapshot(snapshot, parameter_input(v, 0), mem.store) for v in range(3)]
+    for f in forks:
+        f.run()
+        assert STATUS_CODES.FINISHED == f.status
+    assert [0, 4, 0, 2, 0] == mem.memory
+    # Pages are only copied by the fork that writes to them
+    assert snapshot.tape.pages[0] is m.tape.pages[0]
+    assert forks[0].tape.pages[0] is not m.tape.pages[0]
+    assert 0 == m.tape[12]
+
+
+def test_fork_frame():
+    # Outputs 1 to 6, forked part way through a frame
+    tape = [1001, 14, 1, 14, 4, 14, 1007, 14, 6, 15, 1005, 15, 0, 99, 0, 0]
+    frames = []
+    m = IntCode(tape, parameter_input(), frames.append, frame=2)
+    m.run(max_steps=10)
+    assert [(1, 2)] == frames and [3] == m.pending_frame
+    from util.profiler import Profiler
+    m.profiler = Profiler()
+    fork = m.fork(parameter_input(), frames.append)
+    fork.run()
+    assert [(1, 2), (3, 4), (5, 6)] == frames
+    assert 0 < m.profiler.steps and fork.profiler is m.profiler
+
+
+def test_channel():
+    # Outputs 1 to 5, but can only get 2 ahead of whatever is reading them
+    channel = Channel(2)
+    m = IntCode([1001, 14, 1, 14, 4, 14, 1007, 14, 5, 15, 1005, 15, 0, 99, 0, 0], parameter_input(), channel.store)
+    outputs = []
+    while m.status != STATUS_CODES.FINISHED:
+        m.run()
+        if m.status == STATUS_CODES.PAUSED:
+            assert PAUSE_CODES.WRITING == m.pause_code
+            assert 2 == len(channel)
+        outputs.extend(channel.drain())
+    assert [1, 2, 3, 4, 5] == outputs
+    # Used as another machine's input
+    channel.extend([3, 4])
+    out = Channel()
+    m = IntCode([3, 11, 3, 12, 1, 11, 12, 11, 4, 11, 99, 0, 0], channel, out.store)
+    m.run()
+    assert [7] == out.drain()
+
+
+def test_checkpoint(tmp_path):
+    # Echoes its inputs doubled until it reads a 0, with a big value on a far away page
+    tape = [3, 12, 1002, 12, 2, 13, 4, 13, 1005, 12, 0, 99, 0, 0] + [0] * 3000 + [2 ** 70]
+    path = os.path.join(tmp_path, 'machine.ick')
+    channel = Channel()
+    m = IntCode(tape, parameter_input(5), channel.store)
+    m.run()
+    m.save(path)
+    size = os.path.getsize(path)
+    m.stdin = parameter_input(7)
+    m.run()
+    m.save(path)
+    # Only the page holding the program was written to
+    assert os.path.getsize(path) - size == CHECKPOINT_STATE.size + CHECKPOINT_PAGE.size + PAGE_SIZE * 8
+
+    restored = IntCode.load(path, parameter_input(3, 0), channel.store)
+    assert (STATUS_CODES.PAUSED, PAUSE_CODES.READING) == (restored.status, restored.pause_code)
+    assert list(m.tape) == list(restored.tape)
+    restored.run()
+    assert [10, 14, 6, 0] == channel.drain()
+    # A record cut short by a crash is ignored, leaving the previous checkpoint
+    with open(path, 'ab') as f:
+        f.write(CHECKPOINT_STATE.pack(0, 0, 4, 0, 1, 1))
+    torn_size = os.path.getsize(path)
+    os.chmod(path, 0o444)
+    restored = IntCode.load(path, parameter_input(0), channel.store)
+    assert 7 == restored.tape[12]
+    # without changing the file, and written over by the next save so it can be loaded
+    assert torn_size == os.path.getsize(path)
+    os.chmod(path, 0o644)
+    restored.run()
+    restored.save(path)
+    restored = IntCode.load(path)
+    assert STATUS_CODES.FINISHED == restored.status
+    assert list(m.tape)[14:] == list(restored.tape)[14:]
+
+
+def test_time_slicing():
+    # Counts down from 50, then outputs 1
+    tape = [1101, 0, 50, 14, 1001, 14, -1, 14, 1005, 14, 4, 104, 1, 99, 0]
+    for jit in (False, True):
+        channel = Channel()
+        m = IntCode(tape, parameter_input(), channel.store, jit)
+        slices = 0
+        while m.status != STATUS_CODES.FINISHED:
+            m.run(max_steps=10)
+            slices += 1
+            if m.status == STATUS_CODES.PAUSED:
+                assert PAUSE_CODES.YIELDED == m.pause_code
+        # 102 instructions before the halt
+        assert 11 == slices
+        assert [1] == channel.drain()
+    # A block that can leave early after overwriting itself runs exactly as many instructions as interpreted
+    tape = [109, 20, 21101, 7, 0, -13, 1101, 1, 2, 30, 1101, 3, 4, 31, 1105, 1, 0, 99]
+    states = []
+    for jit in (False, True):
+        m = IntCode(tape, parameter_input(), Channel().store, jit)
+        m.run(max_steps=6)
+        states.append((m.position, m.tape.relative_base, list(m.tape)))
+    assert states[0] == states[1]
+    # A loop that never halts is cut off by the deadline
+    m = IntCode([1105, 1, 0], parameter_input(), Channel().store)
+    m.run(deadline=time.monotonic() + 0.01)
+    assert (STATUS_CODES.PAUSED, PAUSE_CODES.YIELDED) == (m.status, m.pause_code)
+
+
+def test_function_cache():
+    cache = FunctionCache(maxsize=2)
+    # Outputs its input plus one
+    tape = [3, 9, 1001, 9, 1, 9, 4, 9, 99, 0]
+    for v in [1, 2, 1, 3, 1, 2]:
+        assert [v + 1] == cache(tape, [v])
+    assert CacheInfo(hits=2, misses=4, maxsize=2, currsize=2) == cache.info()
+    # A run that pauses for more input isn't cached
+    assert [] == cache(tape, [])
+    assert [] == cache(tape, [])
+    assert 6 == cache.info().misses
+    # A Tape keeps its fingerprint until it's written to
+    t = Tape(tape)
+    assert fingerprint(tape) == fingerprint(t) == t.digest == fingerprint(t.copy())
+    assert [2] == cache(t, [1])
+    t[1] = 8
+    assert t.digest is None and fingerprint(t) != fingerprint(tape)
+
+
+def test_framed_output():
+    # Outputs 1 to 6
+    tape = [1001, 14, 1, 14, 4, 14, 1007, 14, 6, 15, 1005, 15, 0, 99, 0, 0]
+    frames = []
+    IntCode(tape, parameter_input(), frames.append, frame=3).run()
+    assert [(1, 2, 3), (4, 5, 6)] == frames
+    channel = Channel(1)
+    m = IntCode(tape, parameter_input(), channel.store, frame=2)
+    frames = []
+    while m.status != STATUS_CODES.FINISHED:
+        m.run()
+        frames.extend(channel.drain())
+    assert [(1, 2), (3, 4), (5, 6)] == frames
+
+
 if __name__ == '__main__':
     # test_1()
     # test_2()
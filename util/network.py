@@ -0,0 +1,130 @@
+from collections import deque
+from typing import Hashable, Iterable, Union
+
+from util.intcode import IntCode, Channel, STATUS_CODES, PAUSE_CODES, Tape
+
+
+class Deadlock(Exception):
+    """
+    Raised when every machine left in a Network is waiting on an empty inbox
+    """
+
+    def __init__(self, waiting: [Hashable]):
+        super().__init__(f'Machines {waiting} are all waiting for input')
+        self.waiting = waiting
+
+
+class Network:
+    """
+    A graph of IntCode machines, each reading from its own inbox Channel.
+    - connect(a, b) sends everything a outputs to b's inbox, so any topology can be built
+    - run() only resumes machines with something in their inbox, so its cost follows the messages sent
+    """
+
+    def __init__(self):
+        self.machines: {Hashable: IntCode} = {}
+        self.inboxes: {Hashable: Channel} = {}
+        # The inboxes each machine's output is sent to
+        self.edges: {Hashable: [Channel]} = {}
+        # Machines waiting on an empty inbox, keyed by that inbox
+        self.waiting: {int: Hashable} = {}
+        self.ready = deque()
+
+    def add(self, name: Hashable, tape: Union[Tape, Iterable[int]], jit: bool = False) -> IntCode:
+        inbox = self.inboxes[name] = Channel()
+        self.edges[name] = []
+        m = self.machines[name] = IntCode(tape, inbox, lambda v: self.__send(name, v), jit)
+        self.ready.append(name)
+        return m
+
+    def connect(self, source: Hashable, destination: Hashable):
+        self.edges[source].append(self.inboxes[destination])
+
+    def tap(self, source: Hashable) -> Channel:
+        """
+        Returns a Channel receiving a copy of everything source outputs
+        """
+        channel = Channel()
+        self.edges[source].append(channel)
+        return channel
+
+    def inbox(self, name: Hashable) -> Channel:
+        return self.inboxes[name]
+
+    def send(self, name: Hashable, *values: int):
+        self.inboxes[name].extend(values)
+        self.__wake(self.inboxes[name])
+
+    def __send(self, source: Hashable, value: int):
+        for channel in self.edges[source]:
+            channel.store(value)
+            self.__wake(channel)
+
+    def __wake(self, channel: Channel):
+        name = self.waiting.pop(id(channel), None)
+        if name is not None:
+            self.ready.append(name)
+
+    def run(self, max_steps: int = None):
+        """
+        Runs until every machine has halted, raising Deadlock if any are left waiting for input
+        :param max_steps: Time slices the machines, so one busy machine can't hold up the rest
+        """
+        while self.ready:
+            name = self.ready.popleft()
+            m = self.machines[name]
+            m.run(max_steps)
+            if m.status == STATUS_CODES.PAUSED and m.pause_code == PAUSE_CODES.YIELDED:
+                self.ready.append(name)
+            elif m.status == STATUS_CODES.PAUSED:
+                self.waiting[id(self.inboxes[name])] = name
+        if self.waiting:
+            raise Deadlock(list(self.waiting.values()))
+
+
+def test_ring():
+    tape = [3, 26, 1001, 26, -4, 26, 3, 27, 1002, 27, 2, 27, 1, 27, 26,
+            27, 4, 27, 1001, 28, -1, 28, 1005, 28, 6, 99, 0, 0, 5]
+    n = Network()
+    for x, phase in enumerate([9, 8, 7, 6, 5]):
+        n.add(x, tape)
+        n.send(x, phase)
+    for x in range(5):
+        n.connect(x, (x + 1) % 5)
+    n.send(0, 0)
+    n.run(max_steps=3)
+    assert 139629729 == n.inbox(0).drain()[-1]
+
+
+def test_fan_in_and_out():
+    # Doubles its input
+    doubler = [3, 9, 1002, 9, 2, 9, 4, 9, 99, 0]
+    n = Network()
+    n.add('source', [104, 5, 99])
+    n.add('left', doubler)
+    n.add('right', doubler)
+    n.add('sum', [3, 13, 3, 14, 1, 13, 14, 15, 4, 15, 99, 0, 0, 0, 0, 0])
+    n.connect('source', 'left')
+    n.connect('source', 'right')
+    n.connect('left', 'sum')
+    n.connect('right', 'sum')
+    out = n.tap('sum')
+    n.run()
+    assert [20] == out.drain()
+
+
+def test_deadlock():
+    n = Network()
+    n.add('a', [3, 5, 4, 5, 99, 0])
+    n.add('b', [3, 5, 4, 5, 99, 0])
+    n.connect('a', 'b')
+    n.connect('b', 'a')
+    try:
+        n.run()
+        assert False
+    except Deadlock as e:
+        assert {'a', 'b'} == set(e.waiting)
+    # Feeding in the missing input lets it finish
+    n.send('a', 7)
+    n.run()
+    assert [7] == n.inbox('a').drain()
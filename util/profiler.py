@@ -0,0 +1,132 @@
+import json
+import time
+from collections import Counter
+
+from util.intcode import IntCode, Channel, parameter_input, STATUS_CODES
+
+OP_NAMES = {
+    1: 'add',
+    2: 'mul',
+    3: 'input',
+    4: 'output',
+    5: 'jump_if_true',
+    6: 'jump_if_false',
+    7: 'less_than',
+    8: 'equals',
+    9: 'adjust_relative_base',
+    99: 'halt'
+}
+
+# The index of the parameter each op code writes to
+WRITE_PARAMS = {1: 2, 2: 2, 3: 0, 7: 2, 8: 2}
+
+
+class Profiler:
+    """
+    Records where an IntCode machine spends its time, pass one to IntCode(..., profiler=Profiler()).
+    - op_codes counts executions of each op code, and addresses executions of the instruction at each address
+    - reads and writes count the accesses each instruction makes to each address
+    - running_time is the time spent inside run(), and input_time the time spent paused waiting for input
+    """
+
+    def __init__(self):
+        self.op_codes = Counter()
+        self.addresses = Counter()
+        self.reads = Counter()
+        self.writes = Counter()
+        self.steps = 0
+        self.running_time = 0.0
+        self.input_time = 0.0
+        self.__resumed_at = None
+        self.__paused_at = None
+
+    def resume(self):
+        self.__resumed_at = time.perf_counter()
+        if self.__paused_at is not None:
+            self.input_time += self.__resumed_at - self.__paused_at
+            self.__paused_at = None
+
+    def pause(self, reading: bool):
+        now = time.perf_counter()
+        self.running_time += now - self.__resumed_at
+        if reading:
+            self.__paused_at = now
+
+    def record(self, position: int, op_code: int, params: [(int, int)], relative_base: int):
+        self.steps += 1
+        self.op_codes[op_code] += 1
+        self.addresses[position] += 1
+        write = WRITE_PARAMS.get(op_code)
+        for i, (mode, param) in enumerate(params):
+            if mode == 1:
+                continue
+            address = param if mode == 0 else relative_base + param
+            if i == write:
+                self.writes[address] += 1
+            else:
+                self.reads[address] += 1
+
+    def instructions_per_second(self) -> float:
+        return self.steps / self.running_time if self.running_time else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            'steps': self.steps,
+            'running_time': self.running_time,
+            'input_time': self.input_time,
+            'instructions_per_second': self.instructions_per_second(),
+            'op_codes': {OP_NAMES.get(k, str(k)): v for k, v in self.op_codes.most_common()},
+            'addresses': {str(k): v for k, v in self.addresses.most_common()},
+            'reads': {str(k): v for k, v in self.reads.most_common()},
+            'writes': {str(k): v for k, v in self.writes.most_common()}
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_folded(self, tape: [int]) -> str:
+        """
+        Instruction counts in the folded stack format read by flamegraph.pl and speedscope,
+        as one 'op_code;address count' line per address
+        """
+        lines = []
+        for address, count in sorted(self.addresses.items()):
+            name = OP_NAMES.get(tape[address] % 100, str(tape[address]))
+            lines.append(f'{name};{address} {count}')
+        return '\n'.join(lines)
+
+
+def profile(tape: [int], parameters: [int]) -> Profiler:
+    """
+    Profiles running tape as a function of parameters
+    """
+    profiler = Profiler()
+    m = IntCode(tape, parameter_input(*parameters), Channel().store, profiler=profiler)
+    m.run()
+    return profiler
+
+
+def test_profile():
+    # Outputs 1 to 5
+    tape = [1001, 14, 1, 14, 4, 14, 1007, 14, 5, 15, 1005, 15, 0, 99, 0, 0]
+    p = profile(tape, [])
+    assert 21 == p.steps
+    assert {1: 5, 4: 5, 7: 5, 5: 5, 99: 1} == p.op_codes
+    assert 5 == p.addresses[0]
+    assert 5 == p.writes[14] and 15 == p.reads[14]
+    assert 'add;0 5' == p.to_folded(tape).splitlines()[0]
+    assert 21 == json.loads(p.to_json())['steps']
+
+
+def test_input_time():
+    p = Profiler()
+    channel = Channel()
+    m = IntCode([3, 7, 4, 7, 1105, 1, 0, 0], channel, Channel().store, profiler=p)
+    m.run()
+    assert STATUS_CODES.PAUSED == m.status
+    time.sleep(0.01)
+    channel.extend([1])
+    m.run()
+    assert 0.01 <= p.input_time
+    # The pausing input instruction is only counted once it completes
+    assert 1 == p.op_codes[3]
@@ -0,0 +1,272 @@
+"""
+Spreads run_as_function sweeps over worker processes, on this host or others, through TCP.
+
+    python -m util.sweep worker HOST PORT [--jit]
+
+A Coordinator listens for workers, which can join or leave at any time. Each worker is sent a tape once,
+identified by its fingerprint, then batches of inputs to run it on. A batch in flight on a worker that disconnects
+is queued again for the others, up to MAX_ATTEMPTS times. A batch whose program raises fails the sweep with a
+SweepError rather than taking down the worker.
+
+Messages are JSON objects, each sent with its length as a 4 byte big-endian prefix:
+- {'type': 'tape', 'id': fingerprint, 'tape': [...]}, before the first batch needing it
+- {'type': 'batch', 'id': n, 'tape': fingerprint, 'inputs': [[...], ...]}
+- {'type': 'result', 'id': n, 'outputs': [[...], ...]}, from the worker
+- {'type': 'error', 'id': n, 'input': [...], 'error': message}, from the worker if running an input raised
+"""
+import argparse
+import itertools
+import json
+import queue
+import socket
+import struct
+import sys
+import threading
+from typing import Iterator, Iterable, Union, Tuple, List
+
+from util.intcode import run_as_function, fingerprint
+
+LENGTH = struct.Struct('>I')
+
+# How many workers a batch is sent to before it's given up on
+MAX_ATTEMPTS = 3
+
+
+class SweepError(Exception):
+    """
+    Raised by a sweep's results when one of its batches fails
+    """
+    pass
+
+
+def send(sock: socket.socket, message: dict):
+    data = json.dumps(message).encode()
+    sock.sendall(LENGTH.pack(len(data)) + data)
+
+
+def receive_exactly(sock: socket.socket, size: int) -> Union[bytes, None]:
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return bytes(data)
+
+
+def receive(sock: socket.socket) -> Union[dict, None]:
+    """
+    Returns the next message, or None once the other end has closed the connection
+    """
+    header = receive_exactly(sock, LENGTH.size)
+    if header is None:
+        return None
+    data = receive_exactly(sock, LENGTH.unpack(header)[0])
+    return None if data is None else json.loads(data)
+
+
+class Coordinator:
+    """
+    Hands out batches of sweeps to whichever workers are connected.
+    - sweep() queues every batch straight away, and returns an iterator over the results
+    - Batches are taken in the order they were queued, so sweeps run one after another
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, batch_size: int = 64):
+        self.batch_size = batch_size
+        self.tapes = {}
+        # (sweep results queue, batch number, tape fingerprint, inputs, attempts so far)
+        self.batches = queue.Queue()
+        self.ids = itertools.count()
+        self.closed = threading.Event()
+        self.server = socket.create_server((host, port))
+        self.server.settimeout(0.1)
+        threading.Thread(target=self.__accept, daemon=True).start()
+
+    @property
+    def address(self) -> (str, int):
+        return self.server.getsockname()[:2]
+
+    def __accept(self):
+        while not self.closed.is_set():
+            try:
+                sock, _ = self.server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            threading.Thread(target=self.__serve, args=(sock,), daemon=True).start()
+
+    def __serve(self, sock: socket.socket):
+        # The tapes this worker has been sent
+        sent = set()
+        try:
+            while not self.closed.is_set():
+                try:
+                    batch = self.batches.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                results, n, tape_id, inputs, attempts = batch
+                try:
+                    if tape_id not in sent:
+                        send(sock, {'type': 'tape', 'id': tape_id, 'tape': self.tapes[tape_id]})
+                        sent.add(tape_id)
+                    send(sock, {'type': 'batch', 'id': n, 'tape': tape_id, 'inputs': inputs})
+                    reply = receive(sock)
+                except OSError:
+                    reply = None
+                if reply is None:
+                    # Lost the worker, someone else has to run its batch unless it keeps losing them
+                    if attempts + 1 < MAX_ATTEMPTS:
+                        self.batches.put((results, n, tape_id, inputs, attempts + 1))
+                    else:
+                        results.put((n, SweepError('Batch %d lost %d workers' % (n, MAX_ATTEMPTS))))
+                    return
+                if reply['type'] == 'error':
+                    results.put((n, SweepError('Batch %d failed on input %s: %s'
+                                               % (n, reply['input'], reply['error']))))
+                    continue
+                results.put((n, reply['outputs']))
+        finally:
+            sock.close()
+
+    def sweep(self, tape: [int], inputs: Iterable[Iterable[int]], ordered: bool = True,
+              timeout: float = None) -> Iterator[Union[List[int], Tuple[int, List[int]]]]:
+        """
+        Runs run_as_function(tape, i) for every i in inputs on the workers.
+        Yields the outputs in the order of inputs, or if not ordered (index, outputs) as each batch completes.
+        Raises TimeoutError if no batch completes within timeout seconds, and SweepError if a batch fails.
+        """
+        tape = list(tape)
+        tape_id = fingerprint(tape)
+        self.tapes[tape_id] = tape
+        results = queue.Queue()
+        inputs = [list(i) for i in inputs]
+        starts = list(range(0, len(inputs), self.batch_size))
+        sweep_id = next(self.ids)
+        for n, start in enumerate(starts):
+            self.batches.put((results, n, tape_id, inputs[start:start + self.batch_size], 0))
+
+        def gather():
+            completed = {}
+            next_batch = 0
+            for _ in starts:
+                try:
+                    n, outputs = results.get(timeout=timeout)
+                except queue.Empty:
+                    raise TimeoutError('Sweep %d got no results for %s seconds' % (sweep_id, timeout))
+                if isinstance(outputs, SweepError):
+                    raise outputs
+                if not ordered:
+                    for i, o in enumerate(outputs):
+                        yield starts[n] + i, o
+                    continue
+                completed[n] = outputs
+                while next_batch in completed:
+                    yield from completed.pop(next_batch)
+                    next_batch += 1
+
+        return gather()
+
+    def close(self):
+        self.closed.set()
+        self.server.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def worker(host: str, port: int, jit: bool = False):
+    """
+    Runs batches from the coordinator at host:port until it closes the connection
+    """
+    tapes = {}
+    with socket.create_connection((host, port)) as sock:
+        while True:
+            message = receive(sock)
+            if message is None:
+                return
+            if message['type'] == 'tape':
+                tapes[message['id']] = message['tape']
+                continue
+            tape = tapes[message['tape']]
+            outputs = []
+            for i in message['inputs']:
+                try:
+                    outputs.append(run_as_function(tape, i, jit))
+                except Exception as e:
+                    send(sock, {'type': 'error', 'id': message['id'], 'input': i, 'error': repr(e)})
+                    break
+            else:
+                send(sock, {'type': 'result', 'id': message['id'], 'outputs': outputs})
+
+
+def main(argv: [str] = None) -> int:
+    parser = argparse.ArgumentParser(description='Runs IntCode sweeps for a coordinator')
+    parser.add_argument('mode', choices=['worker'])
+    parser.add_argument('host')
+    parser.add_argument('port', type=int)
+    parser.add_argument('--jit', action='store_true', help='Compile the tape rather than interpreting it')
+    args = parser.parse_args(argv)
+    worker(args.host, args.port, args.jit)
+    return 0
+
+
+def test_sweep():
+    # Outputs its input plus one
+    tape = [3, 9, 1001, 9, 1, 9, 4, 9, 99, 0]
+    with Coordinator(batch_size=7) as coordinator:
+        for _ in range(3):
+            threading.Thread(target=worker, args=coordinator.address, daemon=True).start()
+        inputs = [[v] for v in range(100)]
+        assert [[v + 1] for v in range(100)] == list(coordinator.sweep(tape, inputs, timeout=10))
+        unordered = sorted(coordinator.sweep(tape, inputs, ordered=False, timeout=10))
+        assert [(v, [v + 1]) for v in range(100)] == unordered
+
+
+def test_lost_worker():
+    tape = [3, 9, 1001, 9, 1, 9, 4, 9, 99, 0]
+    with Coordinator(batch_size=10) as coordinator:
+        results = coordinator.sweep(tape, [[v] for v in range(30)], timeout=10)
+        # Takes the tape and a batch, then disconnects without running it
+        with socket.create_connection(coordinator.address) as sock:
+            assert 'tape' == receive(sock)['type']
+            assert 'batch' == receive(sock)['type']
+        threading.Thread(target=worker, args=coordinator.address, daemon=True).start()
+        assert [[v + 1] for v in range(30)] == list(results)
+
+
+def test_failing_input():
+    # Jumps to its input, which is a bad op code for any input but 99
+    tape = [3, 7, 1105, 1, 7, 0, 0, 0]
+    with Coordinator(batch_size=2) as coordinator:
+        threading.Thread(target=worker, args=coordinator.address, daemon=True).start()
+        try:
+            list(coordinator.sweep(tape, [[99], [50], [99]], timeout=10))
+            assert False
+        except SweepError as e:
+            assert '[50]' in str(e)
+        # The worker is still there for the next sweep
+        assert [[], []] == list(coordinator.sweep(tape, [[99], [99]], timeout=10))
+
+
+def test_batch_gives_up():
+    tape = [3, 9, 1001, 9, 1, 9, 4, 9, 99, 0]
+    with Coordinator() as coordinator:
+        results = coordinator.sweep(tape, [[1]], timeout=10)
+        for _ in range(MAX_ATTEMPTS):
+            with socket.create_connection(coordinator.address) as sock:
+                receive(sock)
+                receive(sock)
+        try:
+            list(results)
+            assert False
+        except SweepError:
+            pass
+
+
+if __name__ == '__main__':
+    sys.exit(main())
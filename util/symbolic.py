@@ -0,0 +1,295 @@
+from collections import namedtuple
+from typing import Union, Callable
+
+from util.intcode import IntCode, Tape, STATUS_CODES, PAUSE_CODES
+
+
+class SymbolicControlFlow(Exception):
+    """
+    Raised when the path through a program depends on a symbol, so it has no single closed form.
+    That's any jump condition or target, instruction, relative base or written to address that isn't a constant.
+    """
+    pass
+
+
+def atom_key(atom):
+    return str(atom), hash(atom)
+
+
+def as_terms(v) -> dict:
+    return v.terms if isinstance(v, Poly) else {(): v}
+
+
+def evaluate(v, env: {str: int}) -> int:
+    return v if isinstance(v, int) else v.evaluate(env)
+
+
+class Poly:
+    """
+    A polynomial in canonical form, whose atoms are either symbol names or Compare and Load expressions.
+    terms maps each monomial, a sorted tuple of atoms, to its coefficient.
+    Arithmetic that leaves only a constant returns an int, so a Poly always depends on some atom.
+    """
+
+    def __init__(self, terms: {tuple: int}):
+        self.terms = terms
+
+    @staticmethod
+    def of(terms: {tuple: int}) -> Union[int, 'Poly']:
+        terms = {m: c for m, c in terms.items() if c != 0}
+        if not terms:
+            return 0
+        if list(terms) == [()]:
+            return terms[()]
+        return Poly(terms)
+
+    def __add__(self, other):
+        terms = dict(self.terms)
+        for m, c in as_terms(other).items():
+            terms[m] = terms.get(m, 0) + c
+        return Poly.of(terms)
+
+    __radd__ = __add__
+
+    def __neg__(self):
+        return Poly({m: -c for m, c in self.terms.items()})
+
+    def __sub__(self, other):
+        return self + -other
+
+    def __rsub__(self, other):
+        return -self + other
+
+    def __mul__(self, other):
+        terms = {}
+        for m1, c1 in self.terms.items():
+            for m2, c2 in as_terms(other).items():
+                m = tuple(sorted(m1 + m2, key=atom_key))
+                terms[m] = terms.get(m, 0) + c1 * c2
+        return Poly.of(terms)
+
+    __rmul__ = __mul__
+
+    def __eq__(self, other):
+        return isinstance(other, Poly) and self.terms == other.terms
+
+    def __hash__(self):
+        return hash(frozenset(self.terms.items()))
+
+    def __str__(self):
+        terms = []
+        for m, c in sorted(self.terms.items(), key=lambda t: (-len(t[0]), [atom_key(a) for a in t[0]])):
+            factors = ([] if c == 1 and m else [str(c)]) + list(map(str, m))
+            terms.append('*'.join(factors))
+        return ' + '.join(terms)
+
+    __repr__ = __str__
+
+    def symbols(self) -> {str}:
+        names = set()
+        for m in self.terms:
+            for atom in m:
+                names |= {atom} if isinstance(atom, str) else atom.symbols()
+        return names
+
+    def evaluate(self, env: {str: int}) -> int:
+        total = 0
+        for m, c in self.terms.items():
+            for atom in m:
+                c *= env[atom] if isinstance(atom, str) else atom.evaluate(env)
+            total += c
+        return total
+
+
+class Compare:
+    """
+    1 if left op right else 0, where op is '<' or '=='
+    """
+    OPS = {'<': lambda a, b: a < b, '==': lambda a, b: a == b}
+
+    def __init__(self, op: str, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+
+    @staticmethod
+    def of(op: str, left, right) -> Union[int, Poly]:
+        difference = left - right
+        if isinstance(difference, int):
+            return int(Compare.OPS[op](difference, 0))
+        return Poly({(Compare(op, left, right),): 1})
+
+    def __eq__(self, other):
+        return isinstance(other, Compare) and (self.op, self.left, self.right) == (other.op, other.left, other.right)
+
+    def __hash__(self):
+        return hash((self.op, self.left, self.right))
+
+    def __str__(self):
+        return f'({self.left} {self.op} {self.right})'
+
+    def symbols(self) -> {str}:
+        return set().union(*(v.symbols() for v in (self.left, self.right) if isinstance(v, Poly)))
+
+    def evaluate(self, env: {str: int}) -> int:
+        return int(Compare.OPS[self.op](evaluate(self.left, env), evaluate(self.right, env)))
+
+
+class Load:
+    """
+    The value at a symbolic address, read from a copy of the tape taken when the program read it
+    """
+
+    def __init__(self, address: Poly, tape: Tape):
+        self.address = address
+        self.tape = tape
+
+    def __str__(self):
+        return f'tape[{self.address}]'
+
+    def symbols(self) -> {str}:
+        return self.address.symbols()
+
+    def evaluate(self, env: {str: int}) -> int:
+        return evaluate(self.tape[evaluate(self.address, env)], env)
+
+
+def symbol(name: str) -> Poly:
+    return Poly({(name,): 1})
+
+
+def to_function(expression, *names: str) -> Callable[..., int]:
+    """
+    Turns an expression into a function of the symbols in names, in that order
+    """
+    return lambda *values: evaluate(expression, dict(zip(names, values)))
+
+
+class SymbolicIntCode(IntCode):
+    """
+    An IntCode machine whose tape and input may hold symbols as well as ints.
+    Arithmetic and comparisons on symbols build simplified expressions, which can be written and output as values.
+    Raises SymbolicControlFlow as soon as the program's path depends on a symbol.
+    """
+
+    def __init__(self, tape: [int], stdin, stdout):
+        super().__init__(tape, stdin, stdout)
+
+    def decode(self, position: int):
+        if isinstance(self.tape[position], Poly):
+            raise SymbolicControlFlow(f'The instruction at {position} is {self.tape[position]}')
+        return super().decode(position)
+
+    def address(self, param: (int, int)):
+        mode, raw = param
+        return raw if mode == 0 else self.tape.relative_base + raw
+
+    def read(self, param: (int, int)):
+        if param[0] == 1:
+            return param[1]
+        address = self.address(param)
+        if isinstance(address, Poly):
+            return Poly({(Load(address, self.tape.copy()),): 1})
+        return self.tape[address]
+
+    def write(self, param: (int, int), value):
+        if param[0] == 1:
+            raise ValueError('Can only write to an address')
+        address = self.address(param)
+        if isinstance(address, Poly):
+            raise SymbolicControlFlow(f'Writing {value} to {address}')
+        self.tape[address] = value
+
+    def concrete(self, value, what: str) -> int:
+        if isinstance(value, Poly):
+            raise SymbolicControlFlow(f'{what} at {self.position} is {value}')
+        return value
+
+    def adjust_relative_base_instruction(self, params: [(int, int)]):
+        self.tape.relative_base += self.concrete(self.read(params[0]), 'The relative base adjustment')
+
+    def add_instruction(self, params: [(int, int)]):
+        self.write(params[2], self.read(params[0]) + self.read(params[1]))
+
+    def mul_instruction(self, params: [(int, int)]):
+        self.write(params[2], self.read(params[0]) * self.read(params[1]))
+
+    def input_instruction(self, params: [(int, int)]):
+        try:
+            in_1 = next(self.stdin)
+        except StopIteration:
+            self.status = STATUS_CODES.PAUSED
+            self.pause_code = PAUSE_CODES.READING
+            return
+        self.write(params[0], in_1)
+
+    def output_instruction(self, params: [(int, int)]):
+        self.stdout(self.read(params[0]))
+
+    def jump_if_true_instruction(self, params: [(int, int)]):
+        condition = self.concrete(self.read(params[0]), 'The jump condition')
+        if condition != 0:
+            self.position = self.concrete(self.read(params[1]), 'The jump target')
+
+    def jump_if_false_instruction(self, params: [(int, int)]):
+        condition = self.concrete(self.read(params[0]), 'The jump condition')
+        if condition == 0:
+            self.position = self.concrete(self.read(params[1]), 'The jump target')
+
+    def less_than_instruction(self, params: [(int, int)]):
+        self.write(params[2], Compare.of('<', self.read(params[0]), self.read(params[1])))
+
+    def equals_instruction(self, params: [(int, int)]):
+        self.write(params[2], Compare.of('==', self.read(params[0]), self.read(params[1])))
+
+
+Evaluation = namedtuple('Evaluation', 'outputs tape status')
+
+
+def partial_evaluate(tape: [int], symbols: {int: str} = None, inputs: list = ()) -> Evaluation:
+    """
+    Runs tape with the cells in symbols replaced by symbols of those names.
+    inputs are fed to the program in order, and can be ints or symbols.
+    Returns the outputs and final tape, whose values are ints or expressions in the symbols.
+    """
+    t = list(tape)
+    for address, name in (symbols or {}).items():
+        t[address] = symbol(name)
+    outputs = []
+    m = SymbolicIntCode(t, iter(inputs), outputs.append)
+    m.run()
+    return Evaluation(outputs, m.tape, m.status)
+
+
+def test_simplify():
+    x, y = symbol('x'), symbol('y')
+    assert 0 == x - x
+    assert 3 == (x + 3) - x
+    assert '2*x*y + 3' == str((x + 1) * (y + y) - 2 * y + x + 3 - 2 * x + x)
+    assert 1 == Compare.of('<', x, x + 1)
+    assert 0 == Compare.of('==', x * 2, x + x + 1)
+    assert 16 == to_function(x * y + Compare.of('<', x, y), 'x', 'y')(3, 5)
+
+
+def test_partial_evaluate():
+    # tape[0] = tape[noun] + tape[verb] * tape[11], as in day 2
+    tape = [1, 9, 10, 3, 2, 3, 11, 0, 99, 30, 40, 50]
+    r = partial_evaluate(tape, {1: 'noun', 2: 'verb'})
+    f = to_function(r.tape[0], 'noun', 'verb')
+    for noun in range(12):
+        for verb in range(12):
+            t = list(tape)
+            t[1:3] = noun, verb
+            m = IntCode(t)
+            m.run()
+            assert m.tape[0] == f(noun, verb)
+    # An amplifier, which branches on its phase but not on its signal
+    tape = [3, 30, 3, 31, 1008, 30, 0, 32, 1005, 32, 15, 1001, 31, 7, 31,
+            1002, 31, 10, 31, 1, 31, 30, 31, 4, 31, 99, 0, 0, 0, 0, 0, 0, 0]
+    assert '10*signal' == str(partial_evaluate(tape, inputs=[0, symbol('signal')]).outputs[0])
+    assert '10*signal + 73' == str(partial_evaluate(tape, inputs=[3, symbol('signal')]).outputs[0])
+    try:
+        partial_evaluate([3, 7, 1005, 7, 0, 99, 0, 0], inputs=[symbol('x')])
+        assert False
+    except SymbolicControlFlow:
+        pass
@@ -0,0 +1,144 @@
+"""
+A compiled binary format for tapes, which loads by memory-mapping the file rather than parsing it.
+
+    python -m util.tapefile puzzle_09/input.txt puzzle_09/input.ict
+
+- A header of MAGIC, the format version, the tape's length and the number of escaped cells
+- The cells as little-endian int64s, padded with zeros to a whole number of pages
+- An escape area holding any cells too large for an int64, as (address, byte count, signed little-endian bytes)
+"""
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from util.intcode import Tape, PAGE_SIZE, PAGE_MASK, PAGE_BITS, IntCode, Channel, parameter_input
+
+MAGIC = b'ICTP'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQQ')
+ESCAPE = struct.Struct('<QI')
+
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+def parse(s: str) -> [int]:
+    return list(map(int, s.split(',')))
+
+
+def save(tape: [int], path: str):
+    cells = array('q')
+    escapes = []
+    for address, v in enumerate(tape):
+        if INT64_MIN <= v <= INT64_MAX:
+            cells.append(v)
+        else:
+            cells.append(0)
+            escapes.append((address, v))
+    cells.extend([0] * (-len(cells) % PAGE_SIZE))
+    if sys.byteorder != 'little':
+        cells.byteswap()
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(tape), len(escapes)))
+        f.write(cells.tobytes())
+        for address, v in escapes:
+            data = v.to_bytes((v.bit_length() + 8) // 8, 'little', signed=True)
+            f.write(ESCAPE.pack(address, len(data)))
+            f.write(data)
+
+
+def compile_text(text_path: str, path: str):
+    with open(text_path) as f:
+        save(parse(f.readline()), path)
+
+
+def is_tape_file(path: str) -> bool:
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def load(path: str) -> Tape:
+    """
+    Maps the tape file at path into a Tape without copying it.
+    Every page is shared with the file, and only copied once it's written to.
+    """
+    with open(path, 'rb') as f:
+        # The map stays open for as long as any of the tape's pages reference it
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, _, length, escape_count = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('%s is not a tape file' % path)
+    if version != VERSION:
+        raise ValueError('%s is version %d of the tape format, expected %d' % (path, version, VERSION))
+
+    page_count = -(-length // PAGE_SIZE)
+    end = HEADER.size + page_count * PAGE_SIZE * 8
+    tape = Tape()
+    tape.length = length
+    if sys.byteorder == 'little':
+        cells = memoryview(data)[HEADER.size:end].cast('q')
+        for n in range(page_count):
+            tape.pages[n] = cells[n * PAGE_SIZE:(n + 1) * PAGE_SIZE]
+        tape.shared.update(tape.pages)
+    else:
+        for n in range(page_count):
+            page = tape.pages[n] = array('q')
+            page.frombytes(data[HEADER.size + n * PAGE_SIZE * 8:HEADER.size + (n + 1) * PAGE_SIZE * 8])
+            page.byteswap()
+
+    offset = end
+    for _ in range(escape_count):
+        address, size = ESCAPE.unpack_from(data, offset)
+        offset += ESCAPE.size
+        v = int.from_bytes(data[offset:offset + size], 'little', signed=True)
+        offset += size
+        n = address >> PAGE_BITS
+        tape.pages[n] = list(tape.pages[n])
+        tape.shared.discard(n)
+        tape.pages[n][address & PAGE_MASK] = v
+    return tape
+
+
+def load_tape(path: str) -> Tape:
+    """
+    Loads either a tape file or a comma separated text tape
+    """
+    if is_tape_file(path):
+        return load(path)
+    with open(path) as f:
+        return Tape(parse(f.readline()))
+
+
+def test_round_trip(tmp_path):
+    tape = [109, 1, 204, -1, 1001, 100, 1, 100, 1008, 100, 16, 101, 1006, 101, 0, 99]
+    tape += [0] * PAGE_SIZE + [2 ** 70, -2 ** 64, INT64_MIN]
+    path = os.path.join(tmp_path, 'tape.ict')
+    save(tape, path)
+    assert is_tape_file(path)
+    t = load(path)
+    assert len(tape) == len(t)
+    assert tape == list(t)
+    assert isinstance(t.pages[0], memoryview)
+    assert isinstance(t.pages[1], list)
+    # Runs straight from the mapped pages, copying only the page it writes to
+    channel = Channel()
+    m = IntCode(t, parameter_input(), channel.store)
+    m.run()
+    assert tape[:16] == channel.drain()
+    assert isinstance(t.pages[0], memoryview)
+    assert isinstance(m.tape.pages[0], array)
+    assert m.tape.pages[1] is t.pages[1]
+
+
+def test_load_tape(tmp_path):
+    text_path = os.path.join(tmp_path, 'input.txt')
+    with open(text_path, 'w') as f:
+        f.write('104,1125899906842624,99\n')
+    path = os.path.join(tmp_path, 'input.ict')
+    compile_text(text_path, path)
+    assert [104, 1125899906842624, 99] == list(load_tape(path)) == list(load_tape(text_path))
+
+
+if __name__ == '__main__':
+    compile_text(*sys.argv[1:3])
@@ -0,0 +1,239 @@
+"""
+Compact binary traces of IntCode runs, for reproducing a run offline without its live input.
+
+A trace is MAGIC, the format version and a flags byte, followed by one event per input consumed (I),
+output produced (O) and, if FLAG_BRANCHES is set, conditional jump taken (T) or not taken (F).
+Input and output values are zigzag encoded varints, so small values take a single byte.
+"""
+import os
+from collections.abc import Iterator
+from typing import Callable, Iterable, Union
+
+from util.intcode import IntCode, Tape, Channel, STATUS_CODES
+
+MAGIC = b'ICTR'
+VERSION = 1
+FLAG_BRANCHES = 1
+
+INPUT, OUTPUT, TAKEN, NOT_TAKEN = b'IOTF'
+
+BUFFER_SIZE = 1 << 16
+
+
+class TraceMismatch(Exception):
+    """
+    Raised when a replayed run diverges from its trace
+    """
+    pass
+
+
+def encode(v: int) -> bytes:
+    z = v << 1 if v >= 0 else (-v << 1) - 1
+    data = bytearray()
+    while z > 0x7f:
+        data.append(z & 0x7f | 0x80)
+        z >>= 7
+    data.append(z)
+    return bytes(data)
+
+
+def decode(data: bytes, offset: int) -> (int, int):
+    """
+    Returns the value encoded at offset, and the offset after it
+    """
+    z = 0
+    shift = 0
+    while True:
+        b = data[offset]
+        offset += 1
+        z |= (b & 0x7f) << shift
+        if b < 0x80:
+            break
+        shift += 7
+    return (z >> 1 if z & 1 == 0 else -((z + 1) >> 1)), offset
+
+
+class TraceWriter:
+    """
+    Streams a trace to path through a buffered file. Use as a context manager, or close() it once the run is done.
+    """
+
+    def __init__(self, path: str, branches: bool = False):
+        self.branches = branches
+        self.file = open(path, 'wb', buffering=BUFFER_SIZE)
+        self.file.write(MAGIC + bytes([VERSION, FLAG_BRANCHES if branches else 0]))
+
+    def input(self, v: int):
+        self.file.write(bytes([INPUT]) + encode(v))
+
+    def output(self, v: int):
+        self.file.write(bytes([OUTPUT]) + encode(v))
+
+    def branch(self, taken: bool):
+        self.file.write(bytes([TAKEN if taken else NOT_TAKEN]))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Trace:
+    """
+    A trace read back into memory, as its inputs, outputs and branch outcomes
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError('%s is not a trace' % path)
+        if data[len(MAGIC)] != VERSION:
+            raise ValueError('%s is version %d of the trace format, expected %d' % (path, data[4], VERSION))
+        self.has_branches = bool(data[len(MAGIC) + 1] & FLAG_BRANCHES)
+        self.inputs = []
+        self.outputs = []
+        self.branches = bytearray()
+        offset = len(MAGIC) + 2
+        while offset < len(data):
+            tag = data[offset]
+            offset += 1
+            if tag == INPUT:
+                v, offset = decode(data, offset)
+                self.inputs.append(v)
+            elif tag == OUTPUT:
+                v, offset = decode(data, offset)
+                self.outputs.append(v)
+            elif tag in (TAKEN, NOT_TAKEN):
+                self.branches.append(tag == TAKEN)
+            else:
+                raise ValueError('Unknown event %r at %d of %s' % (chr(tag), offset - 1, path))
+
+
+class RecordedInput(Iterator):
+    """
+    Passes values through from source, recording each one that's consumed.
+    Running out of input isn't recorded, so a Channel can still pause the machine and be refilled.
+    """
+
+    def __init__(self, source: Iterator[int], trace: TraceWriter):
+        self.source = source
+        self.trace = trace
+
+    def __next__(self):
+        v = next(self.source)
+        self.trace.input(v)
+        return v
+
+
+class TracedIntCode(IntCode):
+    """
+    An IntCode machine that records its run to a TraceWriter.
+    Recording branches needs every jump to be interpreted, so it turns off the jit.
+    """
+
+    def __init__(self, tape: Union[Tape, Iterable[int]], stdin: Iterator[int], stdout: Callable[[int], None],
+                 trace: TraceWriter, jit: bool = False):
+        self.trace = trace
+
+        def recorded_output(v: int):
+            # Only recorded once it's been stored, a full Channel retries the write later
+            stdout(v)
+            trace.output(v)
+
+        super().__init__(tape, RecordedInput(stdin, trace), recorded_output, jit and not trace.branches)
+
+    def jump_if_true_instruction(self, params: [(int, int)]):
+        if self.trace.branches:
+            self.trace.branch(self.tape[params[0]] != 0)
+        super().jump_if_true_instruction(params)
+
+    def jump_if_false_instruction(self, params: [(int, int)]):
+        if self.trace.branches:
+            self.trace.branch(self.tape[params[0]] == 0)
+        super().jump_if_false_instruction(params)
+
+
+class ReplayIntCode(IntCode):
+    """
+    An IntCode machine fed the inputs of a trace, raising TraceMismatch as soon as it diverges from the trace.
+    """
+
+    def __init__(self, tape: Union[Tape, Iterable[int]], trace: Trace, jit: bool = False):
+        self.trace = trace
+        self.outputs = []
+        self.branch_count = 0
+        super().__init__(tape, iter(trace.inputs), self.__check_output, jit and not trace.has_branches)
+
+    def __check_output(self, v: int):
+        i = len(self.outputs)
+        if i >= len(self.trace.outputs) or self.trace.outputs[i] != v:
+            expected = self.trace.outputs[i] if i < len(self.trace.outputs) else None
+            raise TraceMismatch('Output %d was %s, the trace has %s' % (i, v, expected))
+        self.outputs.append(v)
+
+    def __check_branch(self, taken: bool):
+        i = self.branch_count
+        if i >= len(self.trace.branches) or self.trace.branches[i] != taken:
+            raise TraceMismatch('Branch %d at %d diverged from the trace' % (i, self.position))
+        self.branch_count += 1
+
+    def jump_if_true_instruction(self, params: [(int, int)]):
+        if self.trace.has_branches:
+            self.__check_branch(self.tape[params[0]] != 0)
+        super().jump_if_true_instruction(params)
+
+    def jump_if_false_instruction(self, params: [(int, int)]):
+        if self.trace.has_branches:
+            self.__check_branch(self.tape[params[0]] == 0)
+        super().jump_if_false_instruction(params)
+
+
+def replay(tape: Union[Tape, Iterable[int]], path: str, jit: bool = False) -> [int]:
+    """
+    Re-runs tape with the inputs recorded at path, returning its outputs.
+    Raises TraceMismatch if the run doesn't reproduce the trace.
+    """
+    trace = Trace(path)
+    m = ReplayIntCode(tape, trace, jit)
+    m.run()
+    if len(m.outputs) != len(trace.outputs):
+        raise TraceMismatch('Produced %d outputs, the trace has %d' % (len(m.outputs), len(trace.outputs)))
+    return m.outputs
+
+
+def test_encode():
+    for v in [0, 1, -1, 63, -64, 64, 2 ** 70, -2 ** 70 - 3]:
+        data = encode(v) + b'x'
+        assert (v, len(data) - 1) == decode(data, 0)
+    assert 1 == len(encode(-64))
+
+
+def test_record_and_replay(tmp_path):
+    # Echoes each input doubled, until it reads a 0
+    tape = [3, 12, 1002, 12, 2, 13, 4, 13, 1005, 12, 0, 99, 0, 0]
+    path = os.path.join(tmp_path, 'run.trace')
+
+    def live_input():
+        yield from [5, 3, 1125899906842624, 0]
+
+    out = Channel()
+    with TraceWriter(path, branches=True) as trace:
+        m = TracedIntCode(tape, live_input(), out.store, trace)
+        m.run()
+    assert STATUS_CODES.FINISHED == m.status
+    assert [10, 6, 2251799813685248, 0] == out.drain()
+
+    assert [10, 6, 2251799813685248, 0] == replay(tape, path)
+    assert [10, 6, 2251799813685248, 0] == replay(tape, path, jit=True)
+    # A different program diverges
+    tape[4] = 3
+    try:
+        replay(tape, path)
+        assert False
+    except TraceMismatch:
+        pass